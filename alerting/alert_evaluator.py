@@ -0,0 +1,34 @@
+from sqlalchemy import func
+from database.db import BlockBaking
+
+def count_missed_unalerted(session, model, delegates):
+    """
+    Number of missed rights not alerted yet per delegate, for BlockBaking or BlockAttestation, in one GROUP BY query.
+    """
+    delegates = set(delegates)
+    rows = session.query(model.delegate, func.count(model.id)).filter(model.successful == 0, model.alerted == 0).group_by(model.delegate).all()
+    return {delegate: count for delegate, count in rows if delegate in delegates}
+
+def find_threshold_crossings(session, model, delegates, threshold):
+    """
+    Delegates whose missed, not yet alerted rights meet or exceed threshold, with their missed count.
+    """
+    return {delegate: count for delegate, count in count_missed_unalerted(session, model, delegates).items() if count >= threshold}
+
+def mark_alerted(session, model, delegates):
+    """
+    Mark the missed rights of the given delegates as alerted with a single UPDATE. Committing is left to the caller.
+    """
+    if not delegates:
+        return 0
+    return session.query(model).filter(model.successful == 0, model.alerted == 0, model.delegate.in_(list(delegates))).update(
+        {model.alerted: 1}, synchronize_session=False)
+
+def mark_bakings_recovered(session, delegate):
+    """
+    Mark the missed and alerted bakings of a delegate as recovered with a single UPDATE.
+    Returns the number of bakings marked, i.e. 0 if there was nothing to recover from.
+    """
+    return session.query(BlockBaking).filter(BlockBaking.delegate == delegate, BlockBaking.successful == 0,
+                                             BlockBaking.alerted == 1, BlockBaking.recovered == 0).update(
+        {BlockBaking.recovered: 1}, synchronize_session=False)
@@ -1,92 +1,70 @@
-import requests
+import atexit
 import os
-import boto3
-import datetime
+import threading
 
 # Optionally send alerts to AWS CloudWatch
 IDENTIFIER = os.getenv('IDENTIFIER', 'tezos-monitor')
 SEND_TO_CLOUDWATCH = os.getenv('SEND_TO_CLOUDWATCH', 'false').lower() == 'true'
 CLOUDWATCH_LOG_GROUP = os.getenv('CLOUDWATCH_LOG_GROUP', 'TezosBakerMonitorAlerts')
 CLOUDWATCH_STREAM_NAME = os.getenv('CLOUDWATCH_STREAM_NAME', IDENTIFIER)
+# Optional CloudWatch Logs endpoint, e.g. a local stub for testing
+CLOUDWATCH_ENDPOINT_URL = os.getenv('CLOUDWATCH_ENDPOINT_URL')
 
 # Optionally send alerts to Telegram
 SEND_TO_TELEGRAM = os.getenv('SEND_TO_TELEGRAM', 'false').lower() == 'true'
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+# Alerts raised within this many seconds are sent as a single Telegram digest
+TELEGRAM_MIN_INTERVAL = float(os.getenv('TELEGRAM_MIN_INTERVAL', 3))
 REGION = os.getenv('AWS_REGION', 'eu-west-1')
 
-def send_message_to_cloudwatch(message):
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def create_cloudwatch_client():
     """
-    Send alert message to AWS CloudWatch log group.
-    Requires AWS credentials to be configured.
+    Create the CloudWatch Logs client. Requires AWS credentials to be configured.
     """
-    
-    client = boto3.client('logs', region_name=REGION)
-    timestamp = int(datetime.datetime.now().timestamp() * 1000)
-    # Ensure log group exists
-    try:
-        client.create_log_group(logGroupName=CLOUDWATCH_LOG_GROUP)
-    except client.exceptions.ResourceAlreadyExistsException:
-        pass
-    # Ensure log stream exists
-    log_stream_name = CLOUDWATCH_STREAM_NAME
-    try:
-        client.create_log_stream(logGroupName=CLOUDWATCH_LOG_GROUP, logStreamName=log_stream_name)
-    except client.exceptions.ResourceAlreadyExistsException:
-        pass
-    # Get the next sequence token
-    response = client.describe_log_streams(logGroupName=CLOUDWATCH_LOG_GROUP, logStreamNamePrefix=log_stream_name)
-    log_streams = response.get('logStreams', [])
-    sequence_token = None
-    if log_streams and 'uploadSequenceToken' in log_streams[0]:
-        sequence_token = log_streams[0]['uploadSequenceToken']
-    # Put log event
-    log_event = {
-        'logGroupName': CLOUDWATCH_LOG_GROUP,
-        'logStreamName': log_stream_name,
-        'logEvents': [
-            {
-                'timestamp': timestamp,
-                'message': message
-            }
-        ]
-    }
-    if sequence_token:
-        log_event['sequenceToken'] = sequence_token
-    client.put_log_events(**log_event)
-    print(f"CloudWatch alert sent: {message}")
+    # boto3 is slow to import, so it is only loaded when CloudWatch is used
+    import boto3
+    return boto3.client('logs', region_name=REGION, endpoint_url=CLOUDWATCH_ENDPOINT_URL)
 
-def send_message_to_telegram(message):
+def get_dispatcher():
     """
-    Send alert message to a Telegram chat using a bot.
-    Requires TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID to be set.
+    Return the dispatcher delivering alerts to the configured channels, created on first use.
+    Returns None if no channel is enabled.
     """
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        print("Telegram bot token or chat ID not set. Cannot send Telegram alert.")
-        return
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    data = {"chat_id": TELEGRAM_CHAT_ID, "text": message}
-    try:
-        response = requests.post(url, data=data)
-        if response.status_code != 200:
-            print(f"Failed to send Telegram alert: {response.text}")
-        else:
-            print(f"Telegram alert sent: {message}")
-    except Exception as e:
-        print(f"Exception sending Telegram alert: {e}")
-    
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            # The channels are only loaded once a message is sent
+            from alerting.dispatcher import AlertDispatcher, CloudWatchChannel, TelegramChannel
+            channels = []
+            if SEND_TO_CLOUDWATCH:
+                channels.append(CloudWatchChannel(CLOUDWATCH_LOG_GROUP, CLOUDWATCH_STREAM_NAME, create_cloudwatch_client))
+            if SEND_TO_TELEGRAM:
+                if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+                    print("Telegram bot token or chat ID not set. Cannot send Telegram alert.")
+                else:
+                    channels.append(TelegramChannel(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, api_url=TELEGRAM_API_URL, min_interval=TELEGRAM_MIN_INTERVAL))
+            if not channels:
+                return None
+            _dispatcher = AlertDispatcher(channels)
+            # Deliver pending messages before the process exits
+            atexit.register(_dispatcher.shutdown)
+        return _dispatcher
 
 def send_alert(message):
     full_message = f"[{IDENTIFIER}]: ALERT - {message}"
     print(full_message)
-    if SEND_TO_CLOUDWATCH:
-        send_message_to_cloudwatch(full_message)
-    if SEND_TO_TELEGRAM:
-        send_message_to_telegram(full_message)
+    dispatcher = get_dispatcher()
+    if dispatcher is not None:
+        dispatcher.submit(full_message, is_alert=True)
 
 def send_log(message):
     full_message = f"[{IDENTIFIER}]: Log - {message}"
     print(full_message)
-    if SEND_TO_CLOUDWATCH:
-        send_message_to_cloudwatch(full_message)
-    
\ No newline at end of file
+    dispatcher = get_dispatcher()
+    if dispatcher is not None:
+        dispatcher.submit(full_message, is_alert=False)
@@ -0,0 +1,110 @@
+import json
+import os
+from collections import deque
+from database.db import BlockBaking, BlockAttestation
+
+class MissWindow:
+    """
+    Missed rights of one kind within the alert window, per delegate: the levels of the misses not alerted yet and,
+    if track_recovery is set, of the alerted misses not recovered yet. Levels are appended in increasing order,
+    so trimming the window only pops from the left.
+    """
+    def __init__(self, track_recovery=False):
+        self.track_recovery = track_recovery
+        self.unalerted = {}  # delegate -> deque of levels
+        self.unrecovered = {}  # delegate -> deque of levels
+
+    def record_miss(self, delegate, level):
+        self.unalerted.setdefault(delegate, deque()).append(level)
+
+    def trim(self, cutoff_level):
+        """
+        Forget the misses before cutoff_level, as the database rows older than the window are removed.
+        """
+        for levels_by_delegate in (self.unalerted, self.unrecovered):
+            for delegate in list(levels_by_delegate):
+                levels = levels_by_delegate[delegate]
+                while levels and levels[0] < cutoff_level:
+                    levels.popleft()
+                if not levels:
+                    del levels_by_delegate[delegate]
+
+    def threshold_crossings(self, delegates, threshold):
+        """
+        Delegates whose misses not alerted yet meet or exceed threshold, with their number of misses.
+        """
+        return {delegate: len(self.unalerted[delegate]) for delegate in delegates
+                if delegate in self.unalerted and len(self.unalerted[delegate]) >= threshold}
+
+    def mark_alerted(self, delegates):
+        for delegate in delegates:
+            levels = self.unalerted.pop(delegate, None)
+            if levels and self.track_recovery:
+                self.unrecovered.setdefault(delegate, deque()).extend(levels)
+
+    def recover(self, delegate):
+        """
+        Forget the alerted misses of a delegate. Returns True if there were any, i.e. if a recovery should be reported.
+        """
+        return self.unrecovered.pop(delegate, None) is not None
+
+    def to_dict(self):
+        return {'unalerted': {delegate: list(levels) for delegate, levels in self.unalerted.items()},
+                'unrecovered': {delegate: list(levels) for delegate, levels in self.unrecovered.items()}}
+
+    def load_dict(self, data):
+        self.unalerted = {delegate: deque(levels) for delegate, levels in data['unalerted'].items()}
+        self.unrecovered = {delegate: deque(levels) for delegate, levels in data['unrecovered'].items()}
+
+class AlertWindows:
+    """
+    In-memory alert state of the monitored delegates, for bakings and attestations. The database rows are kept as history;
+    alert checks and recoveries only use this state. It is saved to a small JSON snapshot for the checkpoint level.
+    """
+    def __init__(self):
+        self.bakings = MissWindow(track_recovery=True)
+        self.attestations = MissWindow()
+
+    def save(self, path, level):
+        """
+        Write the snapshot of the state after processing `level`. The file is replaced atomically.
+        """
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump({'level': level, 'bakings': self.bakings.to_dict(), 'attestations': self.attestations.to_dict()}, f)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path, level):
+        """
+        Load the snapshot at path if it was saved for `level`. Returns None if it is missing, unreadable or for another level.
+        """
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data['level'] != level:
+                return None
+            windows = cls()
+            windows.bakings.load_dict(data['bakings'])
+            windows.attestations.load_dict(data['attestations'])
+            return windows
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @classmethod
+    def from_database(cls, session):
+        """
+        Rebuild the state from the missed rights stored in the database.
+        """
+        windows = cls()
+        for block_level, delegate, alerted, recovered in session.query(
+                BlockBaking.block_level, BlockBaking.delegate, BlockBaking.alerted, BlockBaking.recovered).filter(
+                BlockBaking.successful == 0).order_by(BlockBaking.block_level):
+            if not alerted:
+                windows.bakings.record_miss(delegate, block_level)
+            elif not recovered:
+                windows.bakings.unrecovered.setdefault(delegate, deque()).append(block_level)
+        for block_level, delegate in session.query(BlockAttestation.block_level, BlockAttestation.delegate).filter(
+                BlockAttestation.successful == 0, BlockAttestation.alerted == 0).order_by(BlockAttestation.block_level):
+            windows.attestations.record_miss(delegate, block_level)
+        return windows
@@ -0,0 +1,207 @@
+import queue
+import threading
+import time
+import requests
+from metrics.registry import ALERT_DISPATCH_FAILURES, ALERT_DISPATCH_SECONDS
+
+# Limits of a single CloudWatch put_log_events call
+CLOUDWATCH_MAX_BATCH_EVENTS = 10000
+CLOUDWATCH_MAX_BATCH_BYTES = 1048576
+CLOUDWATCH_EVENT_OVERHEAD_BYTES = 26
+CLOUDWATCH_MAX_BATCH_SPAN_MS = 24 * 3600 * 1000
+# Maximum length of a Telegram message
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+class CloudWatchChannel:
+    """
+    Sends alerts and logs to a CloudWatch log stream, batching pending events into as few put_log_events calls as allowed.
+    The client is created, and the log group and stream are ensured, once per process.
+    """
+    name = 'CloudWatch'
+
+    def __init__(self, log_group, log_stream, client_factory):
+        self.log_group = log_group
+        self.log_stream = log_stream
+        self.client_factory = client_factory
+        self.client = None
+        self.pending = []
+
+    def accepts(self, is_alert):
+        return True
+
+    def add(self, timestamp, message):
+        self.pending.append({'timestamp': timestamp, 'message': message})
+
+    def _ensure_stream(self):
+        if self.client is not None:
+            return
+        client = self.client_factory()
+        try:
+            client.create_log_group(logGroupName=self.log_group)
+        except client.exceptions.ResourceAlreadyExistsException:
+            pass
+        try:
+            client.create_log_stream(logGroupName=self.log_group, logStreamName=self.log_stream)
+        except client.exceptions.ResourceAlreadyExistsException:
+            pass
+        self.client = client
+
+    def _batches(self, events):
+        batch = []
+        batch_bytes = 0
+        for event in events:
+            event_bytes = len(event['message'].encode()) + CLOUDWATCH_EVENT_OVERHEAD_BYTES
+            if batch and (len(batch) >= CLOUDWATCH_MAX_BATCH_EVENTS or batch_bytes + event_bytes > CLOUDWATCH_MAX_BATCH_BYTES
+                          or event['timestamp'] - batch[0]['timestamp'] >= CLOUDWATCH_MAX_BATCH_SPAN_MS):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append(event)
+            batch_bytes += event_bytes
+        if batch:
+            yield batch
+
+    def flush(self, force=False):
+        if not self.pending:
+            return
+        # Events of a batch must be in chronological order
+        events = sorted(self.pending, key=lambda event: event['timestamp'])
+        self._ensure_stream()
+        sent = 0
+        try:
+            for batch in self._batches(events):
+                self.client.put_log_events(logGroupName=self.log_group, logStreamName=self.log_stream, logEvents=batch)
+                sent += len(batch)
+        finally:
+            # Events not accepted stay pending and are sent again on the next flush
+            self.pending = events[sent:]
+        print(f"CloudWatch: sent {len(events)} events")
+
+class TelegramChannel:
+    """
+    Sends alerts to a Telegram chat, coalescing the alerts raised in between into digests sent at most every min_interval seconds.
+    """
+    name = 'Telegram'
+
+    def __init__(self, bot_token, chat_id, api_url='https://api.telegram.org', min_interval=3.0):
+        self.url = f"{api_url.rstrip('/')}/bot{bot_token}/sendMessage"
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.session = requests.Session()
+        self.pending = []
+        self.last_sent = None
+
+    def accepts(self, is_alert):
+        return is_alert
+
+    def add(self, timestamp, message):
+        self.pending.append(message[:TELEGRAM_MAX_MESSAGE_LENGTH])
+
+    def _digests(self):
+        """
+        Join the pending alerts into as few messages as fit the Telegram limit. Yields (text, number of alerts).
+        """
+        digest = []
+        length = 0
+        for message in self.pending:
+            if digest and length + 2 + len(message) > TELEGRAM_MAX_MESSAGE_LENGTH:
+                yield '\n\n'.join(digest), len(digest)
+                digest = []
+                length = 0
+            length += len(message) + (2 if digest else 0)
+            digest.append(message)
+        if digest:
+            yield '\n\n'.join(digest), len(digest)
+
+    def _wait(self):
+        if self.last_sent is not None:
+            time.sleep(max(self.min_interval - (time.monotonic() - self.last_sent), 0))
+
+    def flush(self, force=False):
+        if not self.pending:
+            return
+        if not force and self.last_sent is not None and time.monotonic() - self.last_sent < self.min_interval:
+            return
+        digests = list(self._digests())
+        self.pending = []
+        failed = 0
+        for index, (digest, count) in enumerate(digests):
+            if index > 0:
+                self._wait()
+            response = self.session.post(self.url, data={'chat_id': self.chat_id, 'text': digest}, timeout=10)
+            self.last_sent = time.monotonic()
+            if response.status_code != 200:
+                print(f"Failed to send Telegram alert: {response.text}")
+                failed += 1
+            else:
+                print(f"Telegram alert sent ({count} alerts)")
+        if failed:
+            raise requests.HTTPError(f"{failed} of {len(digests)} digests were rejected")
+
+class AlertDispatcher:
+    """
+    Delivers messages to the alert channels from a background thread, so that block processing never waits on delivery.
+    After the first message, the messages submitted within flush_interval, up to max_batch, are delivered with it.
+    Pending messages are delivered by shutdown().
+    """
+    _STOP = object()
+
+    def __init__(self, channels, flush_interval=1.0, max_batch=1000):
+        self.channels = channels
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, message, is_alert):
+        self.queue.put((int(time.time() * 1000), time.monotonic(), message, is_alert))
+
+    def _run(self):
+        stopping = False
+        # Submission times of the messages added to each channel and not delivered yet
+        waiting = {channel: [] for channel in self.channels}
+        while not stopping:
+            try:
+                items = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                items = []
+            # Let the batch grow for up to flush_interval after its first message, unless it is full or stopping
+            deadline = time.monotonic() + self.flush_interval
+            while items and items[-1] is not self._STOP and len(items) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            for item in items:
+                if item is self._STOP:
+                    stopping = True
+                    continue
+                timestamp, submitted, message, is_alert = item
+                for channel in self.channels:
+                    if channel.accepts(is_alert):
+                        channel.add(timestamp, message)
+                        waiting[channel].append(submitted)
+            for channel in self.channels:
+                try:
+                    channel.flush(force=stopping)
+                except Exception as e:
+                    ALERT_DISPATCH_FAILURES.inc(channel.name)
+                    print(f"Exception sending {channel.name} alert: {e}")
+                    if not channel.pending:
+                        waiting[channel] = []
+                    continue
+                # A channel may hold messages back, e.g. to rate limit; they are delivered once its pending list is empty
+                if waiting[channel] and not channel.pending:
+                    delivered = time.monotonic()
+                    for submitted in waiting[channel]:
+                        ALERT_DISPATCH_SECONDS.observe(delivered - submitted, channel.name)
+                    waiting[channel] = []
+
+    def shutdown(self, timeout=30):
+        if self.thread.is_alive():
+            self.queue.put(self._STOP)
+            self.thread.join(timeout)
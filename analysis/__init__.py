@@ -0,0 +1 @@
+# analysis package init
@@ -0,0 +1,26 @@
+# Kinds of operations in validation pass 0 that attest the previous block for a single delegate
+ATTESTATION_KINDS = ('attestation', 'attestation_with_dal')
+
+def get_attesters_from_contents(contents):
+    """
+    Return the set of delegates that attested, given the operation contents of validation pass 0 of a block.
+    Covers single attestations as well as every committee member of attestations aggregates.
+    """
+    attesters = set()
+    for content in contents:
+        kind = content['kind']
+        if kind in ATTESTATION_KINDS:
+            attesters.add(content['metadata']['delegate'])
+        elif kind == 'attestations_aggregate':
+            for member in content['metadata']['committee']:
+                attesters.add(member['delegate'])
+    return attesters
+
+def get_attesters(consensus_operations):
+    """
+    Return the set of delegates that attested, given the operations of validation pass 0 of a block.
+    """
+    return get_attesters_from_contents(content for operation in consensus_operations for content in operation['contents'])
+
+def get_block_attesters(block_info):
+    return get_attesters(block_info['operations'][0])
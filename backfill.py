@@ -0,0 +1,192 @@
+# Processes a past range of levels or cycles in parallel worker processes and stores the results in the archive tables.
+# The range is split into chunks whose progress is checkpointed, so an interrupted backfill resumes where it stopped.
+# No alert is sent and the live tables are not touched. Levels before the monitor's first run are folded into the cycle rollups.
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import get_context
+from main import CATCHUP_CONCURRENCY, DB_BATCH_LEVELS, delegates, delegate_set, open_session, create_rpc, prefetch_level, print_shard
+from rpc.rights_index import RangeRights, delegates_fingerprint
+from database.db import ArchiveBatch, ArchivedAttestation, ArchivedBaking, BackfillChunk, State
+from database.rollup import Cycles, fold_batch, unfold_counts
+
+BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', 4))
+BACKFILL_CHUNK_LEVELS = int(os.getenv('BACKFILL_CHUNK_LEVELS', 1000))
+
+def cycle_levels(rpc, first_cycle, last_cycle):
+    """
+    First and last level of a range of cycles, as computed by the protocol of the head.
+    """
+    current_cycle = rpc.get_level_info()['cycle']
+    first_level, _ = rpc.get_levels_in_cycle(first_cycle - current_cycle)
+    _, last_level = rpc.get_levels_in_cycle(last_cycle - current_cycle)
+    return first_level, last_level
+
+def cycles_at(rpc, level, cycles=None):
+    """
+    Level to cycle mapping read from the block at level, unless cycles already covers it.
+    """
+    if cycles is not None and cycles.covers(level):
+        return cycles
+    return Cycles.from_rpc(rpc, level)
+
+def delete_archived(session, rpc, first_level, last_level, rollup_first_level):
+    """
+    Delete the archived results of a range, after taking those folded into the rollups back out of them.
+    """
+    folded = []
+    for kind, model in (('baking', ArchivedBaking), ('attestation', ArchivedAttestation)):
+        folded += [(block_level, delegate, successful, kind) for block_level, delegate, successful in session.query(
+            model.block_level, model.delegate, model.successful).filter(model.block_level.between(first_level, min(last_level, rollup_first_level - 1)))]
+    cycles = None
+    rows = []
+    for block_level, delegate, successful, kind in sorted(folded):
+        cycles = cycles_at(rpc, block_level, cycles)
+        rows.append((cycles.cycle_of(block_level), delegate, successful, kind))
+    unfold_counts(session, rows)
+    for model in (ArchivedBaking, ArchivedAttestation):
+        session.query(model).filter(model.block_level.between(first_level, last_level)).delete(synchronize_session=False)
+
+def plan_chunks(session, rpc, first_level, last_level, chunk_size, fingerprint, rollup_first_level):
+    """
+    Split the range into chunks aligned on multiples of chunk_size and return those not completed yet.
+    Chunks completed or interrupted for the same delegates are resumed; any other chunk starts from scratch,
+    replacing the overlapping chunks and their archived results, also outside the chunk.
+    """
+    pending = []
+    start = first_level
+    while start <= last_level:
+        end = min((start // chunk_size + 1) * chunk_size - 1, last_level)
+        chunk = session.get(BackfillChunk, (start, end))
+        if chunk is None or chunk.delegates_fingerprint != fingerprint:
+            # Replaced chunks are dropped whole with their archived results, so no archived level is left without a checkpoint
+            for replaced in session.query(BackfillChunk).filter(BackfillChunk.first_level <= end, BackfillChunk.last_level >= start).all():
+                if replaced.first_level < start or replaced.last_level > end:
+                    print(f"Replacing chunk {replaced.first_level} to {replaced.last_level}: backfill its levels outside "
+                          f"{start} to {end} again to keep them")
+                delete_archived(session, rpc, replaced.first_level, replaced.last_level, rollup_first_level)
+                session.delete(replaced)
+            session.flush()
+            session.add(BackfillChunk(first_level=start, last_level=end, processed_level=start - 1, delegates_fingerprint=fingerprint))
+            pending.append((start, end))
+        elif chunk.processed_level < end:
+            pending.append((start, end))
+        start = end + 1
+    session.commit()
+    return pending
+
+def archive_level(rpc, rights, block_level, batch):
+    """
+    Add the results of the monitored delegates at block_level to batch. Errors are raised, so that the level is retried on resume.
+    """
+    baking_right = rights.get_baker(block_level)
+    if baking_right is not None:
+        baker = rpc.get_block_baker(block_level, timeout=10)
+        batch.add_baking(block_level, baking_right, successful=int(baker == baking_right))
+    attestation_delegates = rights.get_attesters(block_level)
+    if attestation_delegates:
+        attesters = rpc.get_block_attesters(block_level, timeout=10)
+        for delegate in attestation_delegates:
+            batch.add_attestation(block_level, delegate, successful=int(delegate in attesters))
+
+def backfill_chunk(first_level, last_level, finalized_level, rollup_first_level):
+    """
+    Process a chunk in a worker process, from the level after its checkpoint. Returns the number of levels processed.
+    Levels below rollup_first_level are folded into the rollups with each checkpoint, with the cycles read from
+    the blocks of the chunk. Chunks are folded in any order, so runs of misses are followed within a chunk only.
+    """
+    session = open_session()
+    rpc = create_rpc()
+    rpc.finalized_level = finalized_level
+    try:
+        chunk = session.get(BackfillChunk, (first_level, last_level))
+        start_level = chunk.processed_level + 1
+        if start_level > last_level:
+            return 0
+        rights = RangeRights(rpc, delegates, start_level, last_level)
+        batch = ArchiveBatch()
+        cycles = None
+        streaks = {}
+        # As in main.process_levels, levels ahead are fetched in parallel into the RPC cache and processed in order
+        with ThreadPoolExecutor(max_workers=max(CATCHUP_CONCURRENCY, 1)) as executor:
+            prefetches = deque()
+            next_level = start_level
+            for block_level in range(start_level, last_level + 1):
+                while next_level <= last_level and len(prefetches) < CATCHUP_CONCURRENCY:
+                    prefetches.append(executor.submit(prefetch_level, rpc, next_level, delegate_set, rights))
+                    next_level += 1
+                if prefetches:
+                    prefetches.popleft().result()
+                archive_level(rpc, rights, block_level, batch)
+                if block_level == last_level or (block_level - start_level + 1) % DB_BATCH_LEVELS == 0:
+                    cycles = cycles_at(rpc, block_level, cycles)
+                    chunk.processed_level = block_level
+                    # Take the write lock before reading the rollups, so that parallel chunks fold one after the other
+                    session.flush()
+                    fold_batch(session, batch, cycles, streaks, rollup_first_level)
+                    batch.flush(session)
+                    session.commit()
+        return last_level - start_level + 1
+    finally:
+        rpc.close()
+        session.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Store the baking and attestation results of past levels in the archive tables.')
+    range_group = parser.add_mutually_exclusive_group(required=True)
+    range_group.add_argument('--levels', type=int, nargs=2, metavar=('FIRST', 'LAST'), help='Range of block levels')
+    range_group.add_argument('--cycles', type=int, nargs=2, metavar=('FIRST', 'LAST'), help='Range of cycles')
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS, help=f'Number of worker processes (default: {BACKFILL_WORKERS})')
+    parser.add_argument('--chunk-size', type=int, default=BACKFILL_CHUNK_LEVELS,
+                        help=f'Number of levels per chunk (default: {BACKFILL_CHUNK_LEVELS})')
+    args = parser.parse_args()
+
+    print_shard()
+    session = open_session()
+    state = session.query(State).first()
+    if state is None:
+        print("The monitor has not run on this database yet. Run main.py once first, so that the backfilled levels "
+              "before its first level can be folded into the cycle rollups.")
+        return 1
+    rollup_first_level = state.rollup_first_level
+    rpc = create_rpc()
+    finalized_level = rpc.get_latest_finalized_level()
+    first_level, last_level = args.levels if args.levels else cycle_levels(rpc, *args.cycles)
+    if last_level > finalized_level:
+        print(f"Levels after the latest finalized level {finalized_level} are left to the monitor.")
+        last_level = finalized_level
+    if first_level > last_level:
+        print(f"Nothing to backfill between levels {first_level} and {last_level}.")
+        rpc.close()
+        return 0
+
+    pending = plan_chunks(session, rpc, first_level, last_level, args.chunk_size, delegates_fingerprint(delegates), rollup_first_level)
+    rpc.close()
+    if last_level >= rollup_first_level:
+        print(f"Levels from {rollup_first_level} on are already in the cycle rollups of the monitor, they are only archived.")
+    session.close()
+    print(f"Backfilling levels {first_level} to {last_level}: {len(pending)} chunks to process with {args.workers} workers")
+
+    started = time.perf_counter()
+    processed = 0
+    failed = []
+    # Workers are started fresh rather than forked, so they do not share the parent's connections
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=get_context('spawn')) as executor:
+        futures = {executor.submit(backfill_chunk, first, last, finalized_level, rollup_first_level): (first, last) for first, last in pending}
+        for future in as_completed(futures):
+            first, last = futures[future]
+            try:
+                processed += future.result()
+                print(f"Chunk {first} to {last} done")
+            except Exception as e:
+                failed.append((first, last))
+                print(f"Chunk {first} to {last} failed, it resumes from its checkpoint on the next run: {e}")
+    elapsed = time.perf_counter() - started
+    print(f"Processed {processed} levels in {elapsed:.2f} s ({processed / elapsed if elapsed else 0:.2f} levels/s), {len(failed)} chunks failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Time block processing spends raising alerts, and API calls made to deliver them, against stubbed CloudWatch and Telegram
+endpoints answering after a fixed latency. Compares the former synchronous delivery (a new CloudWatch client, the group
+and stream checks and one put_log_events per message, one Telegram message per alert) with the background dispatcher.
+
+Usage:
+    python3 -m benchmarks.bench_alert_dispatch [--messages 200] [--latency-ms 50]
+"""
+import argparse
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+from alerting.dispatcher import AlertDispatcher, CloudWatchChannel, TelegramChannel
+
+class StubCloudWatchClient:
+    """
+    Stands in for a boto3 CloudWatch Logs client, counting calls and events.
+    """
+    class exceptions:
+        class ResourceAlreadyExistsException(Exception):
+            pass
+
+    def __init__(self, counters, latency):
+        self.counters = counters
+        self.latency = latency
+        self.counters['clients'] += 1
+
+    def _call(self, name):
+        time.sleep(self.latency)
+        self.counters[name] += 1
+
+    def create_log_group(self, **kwargs):
+        self._call('create_log_group')
+        raise self.exceptions.ResourceAlreadyExistsException()
+
+    def create_log_stream(self, **kwargs):
+        self._call('create_log_stream')
+        raise self.exceptions.ResourceAlreadyExistsException()
+
+    def describe_log_streams(self, **kwargs):
+        self._call('describe_log_streams')
+        return {'logStreams': [{'logStreamName': kwargs['logStreamNamePrefix']}]}
+
+    def put_log_events(self, **kwargs):
+        self._call('put_log_events')
+        self.counters['events'] += len(kwargs['logEvents'])
+
+class StubTelegramHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        self.server.counters['sendMessage'] += 1
+        body = b'{"ok":true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def new_counters():
+    return {name: 0 for name in ('clients', 'create_log_group', 'create_log_stream', 'describe_log_streams',
+                                 'put_log_events', 'events', 'sendMessage')}
+
+def synchronous_delivery(messages, counters, latency, telegram_url):
+    """
+    The delivery done before the dispatcher: every message is sent before the caller continues.
+    """
+    for message in messages:
+        client = StubCloudWatchClient(counters, latency)
+        for create in (client.create_log_group, client.create_log_stream):
+            try:
+                create()
+            except client.exceptions.ResourceAlreadyExistsException:
+                pass
+        client.describe_log_streams(logGroupName='alerts', logStreamNamePrefix='bench')
+        client.put_log_events(logGroupName='alerts', logStreamName='bench',
+                              logEvents=[{'timestamp': int(time.time() * 1000), 'message': message}])
+        requests.post(telegram_url, data={'chat_id': 'bench', 'text': message}, timeout=10)
+
+def measure(deliver, messages, latency, telegram):
+    counters = new_counters()
+    telegram.counters = counters
+    started = time.perf_counter()
+    drain = deliver(messages, counters, latency, f'http://127.0.0.1:{telegram.server_port}')
+    blocked = time.perf_counter() - started
+    if drain is not None:
+        drain()
+    return blocked, time.perf_counter() - started, counters
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare synchronous and dispatched alert delivery.')
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=50, help='Latency of each stubbed API call')
+    parser.add_argument('--telegram-interval', type=float, default=1.0, help='Minimum seconds between Telegram digests')
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    telegram = ThreadingHTTPServer(('127.0.0.1', 0), StubTelegramHandler)
+    telegram.daemon_threads = True
+    telegram.latency = latency
+    threading.Thread(target=telegram.serve_forever, daemon=True).start()
+    messages = [f"[bench]: ALERT - Delegate tz1delegate{index:05d} missed an attestation at level {1000000 + index}"
+                for index in range(args.messages)]
+
+    def dispatched_delivery(messages, counters, latency, telegram_url):
+        dispatcher = AlertDispatcher([CloudWatchChannel('alerts', 'bench', lambda: StubCloudWatchClient(counters, latency)),
+                                      TelegramChannel('token', 'bench', api_url=telegram_url, min_interval=args.telegram_interval)])
+        for message in messages:
+            dispatcher.submit(message, is_alert=True)
+        return dispatcher.shutdown
+
+    print(f"{args.messages} alerts, {args.latency_ms:g} ms per API call")
+    for name, deliver in (('synchronous', synchronous_delivery), ('dispatcher', dispatched_delivery)):
+        blocked, total, counters = measure(deliver, messages, latency, telegram)
+        calls = sum(count for call, count in counters.items() if call not in ('clients', 'events'))
+        print(f"{name:>12}: caller blocked {1000 * blocked:9.1f} ms, delivered in {1000 * total:9.1f} ms, "
+              f"{counters['clients']} CloudWatch clients, {calls} API calls "
+              f"({counters['put_log_events']} put_log_events for {counters['events']} events, {counters['sendMessage']} Telegram messages)")
+    telegram.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Query count and run time of the alert checks on a synthetic database, comparing the former per-delegate
+evaluation, the aggregated one (one GROUP BY query and one UPDATE per table) and the in-memory alert windows
+(no query, one UPDATE per table to keep the history).
+
+Usage:
+    python3 -m benchmarks.bench_alert_evaluation [--delegates 10 100 1000] [--window 1000]
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from sqlalchemy import event
+from alerting.alert_evaluator import find_threshold_crossings, mark_alerted
+from alerting.alert_window import AlertWindows
+from database.db import get_engine, get_session, init_db, BlockAttestation
+
+def per_delegate_evaluation(session, windows, delegates, threshold):
+    """
+    The evaluation done before the aggregated query: load every missed row of each delegate, then mark them one by one.
+    """
+    alerted = 0
+    for delegate in delegates:
+        missed_unalerted = session.query(BlockAttestation).filter_by(delegate=delegate, successful=0, alerted=0).all()
+        if len(missed_unalerted) >= threshold:
+            alerted += 1
+            for entry in missed_unalerted:
+                entry.alerted = 1
+    session.commit()
+    return alerted
+
+def aggregated_evaluation(session, windows, delegates, threshold):
+    crossings = find_threshold_crossings(session, BlockAttestation, delegates, threshold)
+    mark_alerted(session, BlockAttestation, crossings)
+    session.commit()
+    return len(crossings)
+
+def in_memory_evaluation(session, windows, delegates, threshold):
+    crossings = windows.attestations.threshold_crossings(delegates, threshold)
+    windows.attestations.mark_alerted(crossings)
+    mark_alerted(session, BlockAttestation, crossings)
+    session.commit()
+    return len(crossings)
+
+def populate(path, delegates, window, miss_rate):
+    engine = get_engine(f'sqlite:///{path}')
+    init_db(engine)
+    session = get_session(engine)
+    rng = random.Random(0)
+    rows = [{'block_level': level, 'delegate': delegate, 'successful': int(rng.random() >= miss_rate), 'alerted': 0}
+            for level in range(window) for delegate in delegates]
+    session.bulk_insert_mappings(BlockAttestation, rows)
+    session.commit()
+    session.close()
+    engine.dispose()
+    return len(rows)
+
+def measure(path, evaluate, delegates, threshold):
+    engine = get_engine(f'sqlite:///{path}')
+    session = get_session(engine)
+    # The monitor keeps the windows across runs, so loading them is not measured
+    windows = AlertWindows.from_database(session)
+    queries = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: queries.append(1))
+    started = time.perf_counter()
+    alerted = evaluate(session, windows, delegates, threshold)
+    elapsed = time.perf_counter() - started
+    session.close()
+    engine.dispose()
+    return len(queries), elapsed, alerted
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-delegate, aggregated and in-memory alert evaluation.')
+    parser.add_argument('--delegates', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--window', type=int, default=200, help='Number of levels with a row per delegate')
+    parser.add_argument('--miss-rate', type=float, default=0.05)
+    parser.add_argument('--threshold', type=int, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        for count in args.delegates:
+            delegates = [f'tz1delegate{index:05d}' for index in range(count)]
+            template = os.path.join(directory, f'template-{count}.db')
+            rows = populate(template, delegates, args.window, args.miss_rate)
+            print(f"{count} delegates, {rows} rows:")
+            for name, evaluate in (('per delegate', per_delegate_evaluation), ('aggregated', aggregated_evaluation),
+                                   ('in memory', in_memory_evaluation)):
+                # Each evaluation marks rows as alerted, so each one runs on a fresh copy
+                path = os.path.join(directory, f'{name.replace(" ", "-")}-{count}.db')
+                shutil.copy(template, path)
+                queries, elapsed, alerted = measure(path, evaluate, delegates, args.threshold)
+                print(f"  {name:>12}: {queries:5d} queries, {1000 * elapsed:9.1f} ms, {alerted} delegates alerted")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
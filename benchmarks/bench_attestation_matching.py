@@ -0,0 +1,77 @@
+"""
+Micro-benchmark of attestation matching: the former per-delegate scan of validation pass 0
+against a single pass building the set of attesters.
+
+Usage:
+    python3 -m benchmarks.bench_attestation_matching [--committee-size 400] [--monitored 20] [--blocks block.json ...]
+
+Without --blocks, mainnet-sized synthetic blocks are generated; recorded blocks
+(the JSON of /chains/main/blocks/<level>) can be passed instead.
+"""
+import argparse
+import json
+import time
+from analysis.block_analysis import get_block_attesters
+from benchmarks.fake_node import FakeChain
+
+def scan_for_delegate(block_info, delegate):
+    """
+    The matching done before the attester set: one nested scan of pass 0 per monitored delegate.
+    """
+    for attestation in block_info['operations'][0]:
+        for content in attestation['contents']:
+            if (content['kind'] == 'attestation_with_dal' or content['kind'] == 'attestation') and content['metadata']['delegate'] == delegate:
+                return True
+            if content['kind'] == 'attestations_aggregate':
+                for committee in content['metadata']['committee']:
+                    if committee['delegate'] == delegate:
+                        return True
+    return False
+
+def match_by_scan(block_info, delegates):
+    return {delegate for delegate in delegates if scan_for_delegate(block_info, delegate)}
+
+def match_by_set(block_info, delegates):
+    attesters = get_block_attesters(block_info)
+    return {delegate for delegate in delegates if delegate in attesters}
+
+def measure(function, blocks, delegates, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for block_info in blocks:
+            function(block_info, delegates)
+    return (time.perf_counter() - started) / (repeat * len(blocks))
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare attestation matching strategies.')
+    parser.add_argument('--committee-size', type=int, default=400)
+    parser.add_argument('--aggregate-ratio', type=float, default=0.7)
+    parser.add_argument('--monitored', type=int, default=20, help='Number of monitored delegates')
+    parser.add_argument('--levels', type=int, default=20, help='Number of synthetic blocks')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--blocks', nargs='*', help='Recorded block JSON files to use instead of synthetic blocks')
+    args = parser.parse_args()
+
+    if args.blocks:
+        blocks = []
+        for path in args.blocks:
+            with open(path, 'r') as f:
+                blocks.append(json.load(f))
+        attesters = sorted(set().union(*(get_block_attesters(block_info) for block_info in blocks)))
+    else:
+        chain = FakeChain([], committee_size=args.committee_size, aggregate_ratio=args.aggregate_ratio)
+        blocks = [chain.block(chain.start_level - level) for level in range(args.levels)]
+        attesters = chain.delegates
+    # Monitor the delegates found last in pass 0, the worst case for the scan
+    delegates = attesters[-args.monitored:]
+
+    assert all(match_by_scan(block_info, delegates) == match_by_set(block_info, delegates) for block_info in blocks)
+    operations = sum(len(block_info['operations'][0]) for block_info in blocks) / len(blocks)
+    print(f"{len(blocks)} blocks, {operations:.0f} operations in pass 0 on average, {len(delegates)} monitored delegates")
+    scan_time = measure(match_by_scan, blocks, delegates, args.repeat)
+    set_time = measure(match_by_set, blocks, delegates, args.repeat)
+    print(f"Per-delegate scan: {1000 * scan_time:.3f} ms per block")
+    print(f"Attester set:      {1000 * set_time:.3f} ms per block ({scan_time / set_time:.1f}x faster)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Bytes received and peak memory per level for the ways of reading the baker and the attesters of a block:
+    full    the whole block from /chains/main/blocks/<level>
+    narrow  /metadata for the baker and /operations/0 for the attestations
+    stream  as narrow, with the attestations parsed incrementally (requires ijson)
+
+Usage:
+    python3 -m benchmarks.bench_block_fetch [--committee-size 400] [--levels 50]
+
+Peak memory is the peak of Python allocations while fetching one level, measured with tracemalloc.
+"""
+import argparse
+import tracemalloc
+from analysis.block_analysis import get_block_attesters
+from benchmarks.fake_node import free_port, spawn_fake_node
+from rpc.rpc_client import RPC, ijson
+
+def fetch_full(rpc, level):
+    block_info = rpc.get_block_info(level)
+    return block_info['metadata']['baker'], get_block_attesters(block_info)
+
+def fetch_narrow(rpc, level):
+    return rpc.get_block_baker(level), rpc.get_block_attesters(level)
+
+def measure(node_url, fetch, levels, stream_parse=False):
+    # A cache of 0 bytes stores nothing, so every level is downloaded
+    rpc = RPC(node_url=node_url, cache_max_bytes=0, stream_parse=stream_parse)
+    bytes_before = rpc.total_bytes()
+    peaks = []
+    tracemalloc.start()
+    for level in levels:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        fetch(rpc, level)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    received = rpc.total_bytes() - bytes_before
+    rpc.close()
+    return received / len(levels), sum(peaks) / len(peaks), max(peaks)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare full and narrow block fetches.')
+    parser.add_argument('--committee-size', type=int, default=400)
+    parser.add_argument('--aggregate-ratio', type=float, default=0.5)
+    parser.add_argument('--manager-operations', type=int, default=300)
+    parser.add_argument('--levels', type=int, default=50)
+    args = parser.parse_args()
+
+    port = free_port()
+    node = spawn_fake_node(port, '--block-time', 0, '--start-level', 1000000, '--committee-size', args.committee_size,
+                           '--aggregate-ratio', args.aggregate_ratio, '--manager-operations', args.manager_operations)
+    node_url = f'http://127.0.0.1:{port}'
+    levels = range(1000000 - args.levels, 1000000)
+
+    modes = [('full', fetch_full, False), ('narrow', fetch_narrow, False)]
+    if ijson is not None:
+        modes.append(('stream', fetch_narrow, True))
+    else:
+        print("ijson is not installed, skipping the stream mode.")
+    results = [(name,) + measure(node_url, fetch, levels, stream_parse) for name, fetch, stream_parse in modes]
+    node.terminate()
+
+    print(f"{args.levels} levels, committee of {args.committee_size} delegates, {args.manager_operations} manager operations per block")
+    for name, received, average_peak, max_peak in results:
+        print(f"{name:>6}: {received / 1024:8.1f} KiB received per level, peak memory {average_peak / 1024:8.1f} KiB on average, {max_peak / 1024:8.1f} KiB max")
+
+if __name__ == '__main__':
+    main()
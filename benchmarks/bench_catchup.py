@@ -0,0 +1,121 @@
+"""
+Offline baseline of the catch-up path: runs main.main against a local fake node, with a fresh database,
+and reports levels per second, RPC calls and bytes per level, DB statements and commits, and peak memory.
+
+Usage:
+    python3 -m benchmarks.bench_catchup [--levels 500] [--delegates 10] [--committee-size 400] [--latency-ms 5]
+
+The monitor settings are read from the environment as usual, so variants are compared by setting them, e.g.
+    CATCHUP_CONCURRENCY=1 RIGHTS_INDEX_ENABLED=false python3 -m benchmarks.bench_catchup
+Alerting channels are always disabled.
+"""
+import argparse
+import contextlib
+import io
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from benchmarks.fake_node import configure_monitor, free_port, spawn_fake_node
+
+START_LEVEL = 1000000
+
+class DBCounters:
+    """
+    Counts the statements and commits of every SQLAlchemy engine, and the time spent executing statements.
+    """
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+        self.time = 0.0
+        self._started = {}
+
+    def attach(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        event.listen(Engine, 'before_cursor_execute', self._before)
+        event.listen(Engine, 'after_cursor_execute', self._after)
+        event.listen(Engine, 'commit', self._commit)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self._started[id(cursor)] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+        self.time += time.perf_counter() - self._started.pop(id(cursor), time.perf_counter())
+
+    def _commit(self, conn):
+        self.commits += 1
+
+def run_main(verbose, trace_memory):
+    """
+    Run main.main once. Returns the elapsed time, the RPC client it used and the peak of Python allocations, if traced.
+    """
+    import main
+    clients = []
+    create_rpc = main.create_rpc
+    main.create_rpc = lambda: clients.append(create_rpc()) or clients[-1]
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with output:
+        main.main()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    tracemalloc.stop()
+    return elapsed, clients[0], peak
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure a full catch-up of main.main against a local fake node.')
+    parser.add_argument('--levels', type=int, default=500, help='Number of levels to catch up on')
+    parser.add_argument('--delegates', type=int, default=10, help='Number of monitored delegates')
+    parser.add_argument('--committee-size', type=int, default=400)
+    parser.add_argument('--blocks-per-cycle', type=int, default=10800)
+    parser.add_argument('--miss-rate', type=float, default=0.01)
+    parser.add_argument('--manager-operations', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=5, help='Delay of the fake node before answering each request')
+    parser.add_argument('--trace-memory', action='store_true', help='Also report the peak of Python allocations (slower)')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the monitor')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    port = free_port()
+    cwd = os.getcwd()
+    node = None
+    try:
+        # The fake node serves up to START_LEVEL, so head~2 is START_LEVEL - 2 and the window ends there
+        configure_monitor(directory, f'http://127.0.0.1:{port}', args.levels, args.delegates)
+        node = spawn_fake_node(port, '--delegates', os.path.join(directory, 'delegates.json'), '--block-time', 0,
+                               '--start-level', START_LEVEL, '--committee-size', args.committee_size,
+                               '--blocks-per-cycle', args.blocks_per_cycle, '--miss-rate', args.miss_rate,
+                               '--manager-operations', args.manager_operations, '--latency-ms', args.latency_ms)
+        # main opens state.db in the working directory
+        os.chdir(directory)
+        sys.path.insert(0, cwd)
+        db = DBCounters()
+        db.attach()
+        elapsed, rpc, peak = run_main(args.verbose, args.trace_memory)
+    finally:
+        os.chdir(cwd)
+        if node is not None:
+            node.terminate()
+        shutil.rmtree(directory)
+
+    calls = sum(entry['calls'] for entry in rpc.stats.values())
+    rpc_time = sum(entry['total_time'] for entry in rpc.stats.values())
+    print(f"{args.levels} levels, {args.delegates} monitored delegates, committee of {args.committee_size}, {args.latency_ms:g} ms node latency")
+    print(f"  {args.levels / elapsed:.1f} levels/s ({elapsed:.2f} s)")
+    print(f"  RPC: {calls} calls ({calls / args.levels:.2f} per level), {rpc.total_bytes() / 1024:.1f} KiB "
+          f"({rpc.total_bytes() / 1024 / args.levels:.1f} KiB per level), {rpc_time:.2f} s spent in requests")
+    print(f"  DB: {db.statements} statements, {db.commits} commits, {db.time:.2f} s spent in statements")
+    print(f"  Peak memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB resident"
+          + (f", {peak / 1024 / 1024:.1f} MiB of Python allocations" if peak is not None else ''))
+    rpc.print_stats()
+    rpc.cache.print_stats()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Per-level processing cost as the number of monitored delegates grows, against a local fake node whose committee
+holds every monitored delegate and draws the attesters of each level from it. Compares membership tests on the
+delegate list with the hashed delegate set, with per-level rights queries (filtered by the node for up to
+DELEGATES_PER_QUERY delegates) and with the rights index (rights fetched per cycle, filtered by the node).
+
+Usage:
+    python3 -m benchmarks.bench_delegate_scaling [--delegates 10 100 1000 5000] [--levels 50] [--attesters-per-level 300]
+
+Alerting channels are always disabled.
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from benchmarks.fake_node import configure_monitor, free_port, spawn_fake_node, write_delegates
+
+START_LEVEL = 1000000
+
+def configure(directory, levels):
+    """
+    Set the environment read by main at import time. The delegates are passed to the processing functions directly.
+    """
+    configure_monitor(directory, 'http://127.0.0.1:1', levels, 0)
+    os.environ['ALERT_WINDOW_SNAPSHOT'] = os.path.join(directory, 'state_window.json')
+
+def measure(main, node_url, db_path, delegates, members, use_index, levels):
+    """
+    Process the last `levels` finalized levels with a fresh database and RPC client.
+    Returns the processing time, the time spent indexing rights, and the RPC calls and bytes.
+    """
+    from alerting.alert_window import AlertWindows
+    from rpc.rights_index import DELEGATES_PER_QUERY, RightsIndex
+    from rpc.rpc_client import RPC
+    main.rights_filter = delegates if len(delegates) <= DELEGATES_PER_QUERY else None
+    session = main.open_session(f'sqlite:///{db_path}')
+    with contextlib.redirect_stdout(io.StringIO()):
+        rpc = RPC(node_url=node_url, pool_size=max(main.CATCHUP_CONCURRENCY, 1))
+        finalized_level = rpc.get_latest_finalized_level()
+        first_level = finalized_level - levels + 1
+        indexing = 0.0
+        rights_index = None
+        if use_index:
+            started = time.perf_counter()
+            rights_index = RightsIndex(session, delegates)
+            rights_index.prefetch(rpc, first_level, finalized_level)
+            indexing = time.perf_counter() - started
+        calls_before = sum(entry['calls'] for entry in rpc.stats.values())
+        bytes_before = rpc.total_bytes()
+        started = time.perf_counter()
+        main.process_levels(session, rpc, first_level, finalized_level, members, main.CATCHUP_CONCURRENCY, AlertWindows(), rights_index)
+        elapsed = time.perf_counter() - started
+    calls = sum(entry['calls'] for entry in rpc.stats.values()) - calls_before
+    size = rpc.total_bytes() - bytes_before
+    rpc.close()
+    session.close()
+    return elapsed, indexing, calls, size
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the per-level cost for growing numbers of monitored delegates.')
+    parser.add_argument('--delegates', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--levels', type=int, default=50, help='Number of levels processed per run')
+    parser.add_argument('--attesters-per-level', type=int, default=300, help='Delegates with attestation rights at each level')
+    parser.add_argument('--blocks-per-cycle', type=int, default=256, help='Kept small, so that indexing a cycle stays fast')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Delay of the fake node before answering each request')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        configure(directory, args.levels)
+        import main as monitor
+        print(f"{args.levels} levels per run, {args.attesters_per_level} attesters per level, {args.latency_ms:g} ms node latency")
+        for count in args.delegates:
+            path = os.path.join(directory, f'delegates-{count}.json')
+            delegates = write_delegates(path, count)
+            port = free_port()
+            node = spawn_fake_node(port, '--delegates', path, '--committee-size', max(count, args.attesters_per_level),
+                                   '--attesters-per-level', args.attesters_per_level, '--blocks-per-cycle', args.blocks_per_cycle,
+                                   '--block-time', 0, '--start-level', START_LEVEL, '--manager-operations', 0,
+                                   '--latency-ms', args.latency_ms)
+            print(f"{count} delegates:")
+            try:
+                for name, members, use_index in (('list, per-level rights', delegates, False),
+                                                 ('set, per-level rights', frozenset(delegates), False),
+                                                 ('set, rights index', frozenset(delegates), True)):
+                    db_path = os.path.join(directory, f'{count}-{name.replace(" ", "").replace(",", "-")}.db')
+                    elapsed, indexing, calls, size = measure(monitor, f'http://127.0.0.1:{port}', db_path, delegates, members,
+                                                             use_index, args.levels)
+                    print(f"  {name:>22}: {1000 * elapsed / args.levels:8.2f} ms per level, {calls / args.levels:5.2f} RPC calls "
+                          f"and {size / 1024 / args.levels:7.1f} KiB per level" + (f", indexing {indexing:.2f} s" if use_index else ''))
+            finally:
+                node.terminate()
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
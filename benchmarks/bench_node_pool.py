@@ -0,0 +1,78 @@
+"""
+Latency of finalized block reads through the RPC client with one node and with a pool of local fake nodes
+with different latency profiles:
+    spiky    fast, but a fraction of its answers are very slow
+    steady   slower, without spikes
+    lagging  the fastest, but several levels behind the others
+    down     nothing listening
+
+Usage:
+    python3 -m benchmarks.bench_node_pool [--levels 200] [--spike-ms 500] [--spike-rate 0.05]
+"""
+import argparse
+import time
+from benchmarks.fake_node import free_port, spawn_fake_node
+from rpc.rpc_client import RPC
+
+START_LEVEL = 1000000
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def measure(node_urls, levels, hedge_percentile):
+    # A cache of 0 bytes stores nothing, so every level is downloaded
+    rpc = RPC(node_url=node_urls, cache_max_bytes=0, hedge_percentile=hedge_percentile)
+    finalized_level = rpc.get_latest_finalized_level()
+    latencies = []
+    started = time.perf_counter()
+    for level in range(finalized_level - levels + 1, finalized_level + 1):
+        for fetch in (rpc.get_block_baker, rpc.get_block_attesters):
+            request_started = time.perf_counter()
+            fetch(level)
+            latencies.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+    requests_per_node = {node.url: node.requests for node in rpc.pool.nodes}
+    rpc.close()
+    return elapsed, latencies, requests_per_node
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare a single RPC node with a pool of nodes.')
+    parser.add_argument('--levels', type=int, default=200)
+    parser.add_argument('--committee-size', type=int, default=100)
+    parser.add_argument('--spike-ms', type=float, default=500, help='Additional delay of the slow answers of the spiky node')
+    parser.add_argument('--spike-rate', type=float, default=0.05, help='Fraction of slow answers of the spiky node')
+    args = parser.parse_args()
+
+    profiles = {'spiky': ('--latency-ms', 5, '--spike-ms', args.spike_ms, '--spike-rate', args.spike_rate),
+                'steady': ('--latency-ms', 20),
+                'lagging': ('--latency-ms', 1, '--start-level', START_LEVEL - 10)}
+    urls = {}
+    processes = []
+    for name, options in profiles.items():
+        port = free_port()
+        arguments = ('--block-time', 0, '--start-level', START_LEVEL, '--committee-size', args.committee_size,
+                     '--manager-operations', 0) + options
+        processes.append(spawn_fake_node(port, *arguments))
+        urls[name] = f'http://127.0.0.1:{port}'
+    urls['down'] = f'http://127.0.0.1:{free_port()}'
+    names = {url: name for name, url in urls.items()}
+
+    scenarios = [('spiky only', ['spiky'], 90),
+                 ('pool, no hedging', ['spiky', 'steady', 'lagging', 'down'], 0),
+                 ('pool, hedged at p90', ['spiky', 'steady', 'lagging', 'down'], 90)]
+    try:
+        results = [(name,) + measure([urls[node] for node in nodes], args.levels, hedge_percentile)
+                   for name, nodes, hedge_percentile in scenarios]
+    finally:
+        for process in processes:
+            process.terminate()
+
+    print(f"{args.levels} levels, 2 reads per level, spiky node: {100 * args.spike_rate:g}% of answers {args.spike_ms:g} ms slower")
+    for name, elapsed, latencies, requests_per_node in results:
+        per_node = ', '.join(f"{names[url]} {count}" for url, count in requests_per_node.items())
+        print(f"{name:>20}: {elapsed:6.2f} s, p50 {1000 * percentile(latencies, 0.5):6.1f} ms, p99 {1000 * percentile(latencies, 0.99):6.1f} ms, "
+              f"max {1000 * max(latencies):6.1f} ms, requests per node: {per_node}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Startup cost of cron runs: import time of main, time to construct the RPC client and to complete the first RPC,
+and the wall time of a whole `python3 main.py` run when no new level is finalized, against a local fake node.
+
+Usage:
+    python3 -m benchmarks.bench_startup [--runs 5] [--latency-ms 5]
+
+Alerting channels are always disabled.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.fake_node import configure_monitor, free_port, spawn_fake_node
+
+START_LEVEL = 1000000
+# Root of the repository, whatever the working directory
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter, so that nothing is imported yet
+PROBE = '''
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+rpc = main.create_rpc()
+constructed = time.perf_counter()
+rpc.get_latest_finalized_level()
+first_rpc = time.perf_counter()
+print(json.dumps({'import': imported - started, 'constructor': constructed - imported, 'first_rpc': first_rpc - started}))
+'''
+
+def run(arguments, directory, environment):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable] + arguments, cwd=directory, env=environment, capture_output=True, text=True, check=True)
+    return time.perf_counter() - started, result.stdout
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup cost of main.py.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=5, help='Delay of the fake node before answering each request')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    port = free_port()
+    node = None
+    try:
+        environment = configure_monitor(directory, f'http://127.0.0.1:{port}', 10, environment=dict(os.environ, PYTHONPATH=REPO_DIR))
+        node = spawn_fake_node(port, '--block-time', 0, '--start-level', START_LEVEL, '--committee-size', 100,
+                               '--latency-ms', args.latency_ms)
+        main_path = os.path.join(REPO_DIR, 'main.py')
+        # Catch up once, so that the measured runs find nothing new
+        run([main_path], directory, environment)
+        probes = []
+        for _ in range(args.runs):
+            _, output = run(['-c', PROBE], directory, environment)
+            probes.append(json.loads(output.strip().splitlines()[-1]))
+        no_op_runs = [run([main_path], directory, environment)[0] for _ in range(args.runs)]
+    finally:
+        if node is not None:
+            node.terminate()
+        shutil.rmtree(directory)
+
+    print(f"Median of {args.runs} runs, {args.latency_ms:g} ms node latency:")
+    print(f"  import main:            {1000 * statistics.median(probe['import'] for probe in probes):7.1f} ms")
+    print(f"  RPC constructor:        {1000 * statistics.median(probe['constructor'] for probe in probes):7.1f} ms")
+    print(f"  time to first RPC:      {1000 * statistics.median(probe['first_rpc'] for probe in probes):7.1f} ms (from the start of the imports)")
+    print(f"  run with nothing new:   {1000 * statistics.median(no_op_runs):7.1f} ms (whole process)")
+
+if __name__ == '__main__':
+    main()
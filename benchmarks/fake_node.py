@@ -0,0 +1,407 @@
+"""
+Local stand-in for a Tezos node, serving a synthetic chain that grows by one block every block_time seconds.
+Serves the RPCs used by the monitor, including the /monitor/heads/main stream.
+
+Usage:
+    python3 -m benchmarks.fake_node --port 18732 --delegates delegates.json --block-time 8 [--latency-ms 20]
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+PROTOCOL = 'PtSeouLouXkxhg39oWzjxDWaCydNfR3RxCUrNeVr2pDXBPb3PPd'
+_BLOCK_ID = re.compile(r'^(head|\d+|B[1-9A-HJ-NP-Za-km-z]{50})(?:~(\d+))?$')
+
+def base58_digest(seed, length):
+    digest = int.from_bytes(hashlib.sha256(seed.encode()).digest(), 'big')
+    chars = []
+    while len(chars) < length:
+        digest, remainder = divmod(digest, 58)
+        chars.append(BASE58_ALPHABET[remainder])
+        if digest == 0:
+            digest = int.from_bytes(hashlib.sha256(''.join(chars).encode()).digest(), 'big')
+    return ''.join(chars)
+
+class FakeChain:
+    """
+    Deterministic synthetic chain. Every delegate of the committee has attestation rights at every level, or only
+    attesters_per_level of them drawn at each level if set, the round 0 baker of a level is drawn from the committee,
+    and rights are missed with probability miss_rate.
+    Each block also carries manager_operations transactions, so that full blocks have a realistic size.
+    """
+    def __init__(self, monitored_delegates, committee_size=100, blocks_per_cycle=10800, start_level=1000000,
+                 block_time=8, miss_rate=0.01, aggregate_ratio=0.5, manager_operations=100, seed=0, attesters_per_level=0):
+        self.delegates = list(monitored_delegates)
+        while len(self.delegates) < committee_size:
+            self.delegates.append('tz1' + base58_digest(f'delegate-{len(self.delegates)}', 33))
+        self.blocks_per_cycle = blocks_per_cycle
+        self.start_level = start_level
+        self.block_time = block_time
+        self.miss_rate = miss_rate
+        self.aggregate_ratio = aggregate_ratio
+        self.manager_operations = manager_operations
+        self.seed = seed
+        self.attesters_per_level = attesters_per_level
+        # Drawing the attesters of a level is slow for large committees, and each level is served several times
+        self.attesters = functools.lru_cache(maxsize=4096)(self._draw_attesters)
+        self.started = time.time()
+        self.hashes = {}
+
+    def head_level(self):
+        if self.block_time <= 0:
+            return self.start_level
+        return self.start_level + int((time.time() - self.started) / self.block_time)
+
+    def block_hash(self, level):
+        block_hash = 'BL' + base58_digest(f'{self.seed}-block-{level}', 49)
+        self.hashes[block_hash] = level
+        return block_hash
+
+    def cycle_of(self, level):
+        return level // self.blocks_per_cycle
+
+    def _rng(self, *parts):
+        return random.Random('-'.join(str(part) for part in (self.seed,) + parts))
+
+    def baker_right(self, level, round=0):
+        return self._rng('baker', level, round).choice(self.delegates)
+
+    def baker(self, level):
+        round = 0
+        while self._rng('missed-baking', level, round).random() < self.miss_rate:
+            round += 1
+        return self.baker_right(level, round)
+
+    def _draw_attesters(self, level):
+        if not self.attesters_per_level or self.attesters_per_level >= len(self.delegates):
+            return self.delegates
+        return self._rng('attesters', level).sample(self.delegates, self.attesters_per_level)
+
+    def attested(self, level, delegate):
+        return self._rng('missed-attestation', level, delegate).random() >= self.miss_rate
+
+    def level_info(self, level):
+        return {'level': level, 'level_position': level - 1, 'cycle': self.cycle_of(level),
+                'cycle_position': level % self.blocks_per_cycle, 'expected_commitment': False}
+
+    def header(self, level):
+        return {'level': level, 'proto': 2, 'predecessor': self.block_hash(level - 1),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started + (level - self.start_level) * self.block_time)),
+                'validation_pass': 4, 'fitness': ['02', f'{level:08x}', '', 'ffffffff', '00000000']}
+
+    def metadata(self, level):
+        baker = self.baker(level)
+        return {'protocol': PROTOCOL, 'next_protocol': PROTOCOL, 'baker': baker, 'proposer': baker,
+                'level_info': self.level_info(level), 'consumed_milligas': str(1000 * self.manager_operations),
+                'balance_updates': [{'kind': 'contract', 'contract': baker, 'change': '10000000', 'origin': 'block'},
+                                    {'kind': 'minted', 'category': 'baking rewards', 'change': '-10000000', 'origin': 'block'}]}
+
+    def manager_operations_of(self, level):
+        """
+        Validation pass 3 of block `level`: plain transactions with their receipts.
+        """
+        operations = []
+        for index in range(self.manager_operations):
+            source = 'tz1' + base58_digest(f'source-{level}-{index}', 33)
+            destination = 'tz1' + base58_digest(f'destination-{level}-{index}', 33)
+            balance_updates = [{'kind': 'contract', 'contract': source, 'change': '-1000', 'origin': 'block'},
+                               {'kind': 'contract', 'contract': destination, 'change': '1000', 'origin': 'block'}]
+            operations.append({'protocol': PROTOCOL, 'chain_id': 'NetXdQprcVkpaWU', 'hash': 'o' + base58_digest(f'transaction-{level}-{index}', 50),
+                               'branch': self.block_hash(level - 2),
+                               'contents': [{'kind': 'transaction', 'source': source, 'fee': '400', 'counter': str(index),
+                                             'gas_limit': '1000', 'storage_limit': '0', 'amount': '1000', 'destination': destination,
+                                             'metadata': {'balance_updates': [{'kind': 'contract', 'contract': source, 'change': '-400', 'origin': 'block'}],
+                                                          'operation_result': {'status': 'applied', 'balance_updates': balance_updates,
+                                                                               'consumed_milligas': '1000000'}}}],
+                               'signature': 'sig' + base58_digest(f'transaction-sig-{level}-{index}', 93)})
+        return operations
+
+    def attestation_operations(self, level):
+        """
+        Validation pass 0 of block `level`: the attestations of level - 1.
+        """
+        attested_level = level - 1
+        rng = self._rng('aggregate', attested_level)
+        operations = []
+        committee = []
+        for slot, delegate in enumerate(self.attesters(attested_level)):
+            if not self.attested(attested_level, delegate):
+                continue
+            if rng.random() < self.aggregate_ratio:
+                committee.append({'delegate': delegate, 'consensus_pkh': delegate, 'consensus_power': 1})
+                continue
+            operations.append({'protocol': PROTOCOL, 'chain_id': 'NetXdQprcVkpaWU', 'hash': 'o' + base58_digest(f'op-{level}-{slot}', 50),
+                               'branch': self.block_hash(level - 2),
+                               'contents': [{'kind': 'attestation', 'slot': slot, 'level': attested_level, 'round': 0,
+                                             'block_payload_hash': 'vh' + base58_digest(f'payload-{attested_level}', 50),
+                                             'metadata': {'delegate': delegate, 'consensus_power': 1, 'consensus_key': delegate}}],
+                               'signature': 'sig' + base58_digest(f'sig-{level}-{slot}', 93)})
+        if committee:
+            operations.append({'protocol': PROTOCOL, 'chain_id': 'NetXdQprcVkpaWU', 'hash': 'o' + base58_digest(f'aggregate-{level}', 50),
+                               'branch': self.block_hash(level - 2),
+                               'contents': [{'kind': 'attestations_aggregate',
+                                             'consensus_content': {'level': attested_level, 'round': 0,
+                                                                   'block_payload_hash': 'vh' + base58_digest(f'payload-{attested_level}', 50)},
+                                             'committee': [{'slot': index, 'dal_attestation': '0'} for index in range(len(committee))],
+                                             'metadata': {'committee': committee, 'total_consensus_power': len(committee)}}],
+                               'signature': 'BLsig' + base58_digest(f'aggregate-sig-{level}', 137)})
+        return operations
+
+    def block(self, level):
+        return {'protocol': PROTOCOL, 'chain_id': 'NetXdQprcVkpaWU', 'hash': self.block_hash(level),
+                'header': self.header(level), 'metadata': self.metadata(level),
+                'operations': [self.attestation_operations(level), [], [], self.manager_operations_of(level)]}
+
+    def _levels(self, block_level, query, default_level):
+        if 'cycle' in query:
+            levels = []
+            for cycle in query['cycle']:
+                first_level = int(cycle) * self.blocks_per_cycle
+                levels.extend(range(first_level, first_level + self.blocks_per_cycle))
+            return levels
+        if 'level' in query:
+            return [int(level) for level in query['level']]
+        return [default_level]
+
+    def baking_rights(self, block_level, query):
+        max_round = int(query.get('max_round', ['4'])[0])
+        wanted = set(query.get('delegate', []))
+        rights = []
+        for level in self._levels(block_level, query, block_level + 1):
+            for round in range(max_round + 1):
+                delegate = self.baker_right(level, round)
+                if not wanted or delegate in wanted:
+                    rights.append({'level': level, 'delegate': delegate, 'round': round,
+                                   'estimated_time': self.header(level)['timestamp'], 'consensus_key': delegate})
+        return rights
+
+    def attestation_rights(self, block_level, query):
+        wanted = set(query.get('delegate', []))
+        rights = []
+        for level in self._levels(block_level, query, block_level):
+            rights.append({'level': level, 'delegates': [
+                {'delegate': delegate, 'first_slot': slot, 'attestation_power': 1, 'consensus_key': delegate}
+                for slot, delegate in enumerate(self.attesters(level)) if not wanted or delegate in wanted]})
+        return rights
+
+    def levels_in_cycle(self, level, query):
+        cycle = level // self.blocks_per_cycle + int(query.get('offset', ['0'])[0])
+        return {'first': cycle * self.blocks_per_cycle, 'last': (cycle + 1) * self.blocks_per_cycle - 1}
+
+    def constants(self):
+        return {'blocks_per_cycle': self.blocks_per_cycle, 'consensus_rights_delay': 2,
+                'minimal_block_delay': str(self.block_time), 'consensus_committee_size': len(self.delegates)}
+
+class FakeNodeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        chain = self.server.chain
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        path = parsed.path.rstrip('/')
+        if path == '/monitor/heads/main':
+            return self._stream_heads()
+        # Simulated network and node processing time of a remote node, with occasional slow answers
+        latency = self.server.latency
+        if self.server.spike_rate > 0 and random.random() < self.server.spike_rate:
+            latency += self.server.spike
+        if latency > 0:
+            time.sleep(latency)
+        if path == '/monitor/bootstrapped':
+            head_level = chain.head_level()
+            return self._send_json({'block': chain.block_hash(head_level), 'timestamp': chain.header(head_level)['timestamp']})
+        match = re.match(r'^/chains/main/blocks/([^/]+)(/.*)?$', path)
+        if not match:
+            return self._send_json(['Not found'], status=404)
+        level = self._resolve_block(match.group(1))
+        if level is None or level > chain.head_level():
+            return self._send_json(['Not found'], status=404)
+        subpath = match.group(2) or ''
+        if subpath == '':
+            return self._send_json(chain.block(level))
+        if subpath == '/header':
+            return self._send_json(dict(chain.header(level), hash=chain.block_hash(level)))
+        if subpath == '/metadata':
+            return self._send_json(chain.metadata(level))
+        if subpath == '/operations/0':
+            return self._send_json(chain.attestation_operations(level))
+        if subpath == '/operations/3':
+            return self._send_json(chain.manager_operations_of(level))
+        if subpath == '/helpers/current_level':
+            return self._send_json(chain.level_info(level))
+        if subpath == '/helpers/levels_in_current_cycle':
+            return self._send_json(chain.levels_in_cycle(level, query))
+        if subpath == '/helpers/baking_rights':
+            return self._send_json(chain.baking_rights(level, query))
+        if subpath == '/helpers/attestation_rights':
+            return self._send_json(chain.attestation_rights(level, query))
+        if subpath == '/context/constants':
+            return self._send_json(chain.constants())
+        return self._send_json(['Not found'], status=404)
+
+    def _resolve_block(self, block_id):
+        chain = self.server.chain
+        match = _BLOCK_ID.match(block_id)
+        if not match:
+            return None
+        base, offset = match.groups()
+        if base == 'head':
+            level = chain.head_level()
+        elif base.isdigit():
+            level = int(base)
+        else:
+            level = chain.hashes.get(base)
+            if level is None:
+                return None
+        return level - int(offset or 0)
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream_heads(self):
+        chain = self.server.chain
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        last_sent = None
+        try:
+            while True:
+                head_level = chain.head_level()
+                if head_level != last_sent:
+                    head = dict(chain.header(head_level), hash=chain.block_hash(head_level))
+                    data = (json.dumps(head) + '\n').encode()
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                    self.wfile.flush()
+                    last_sent = head_level
+                time.sleep(min(max(chain.block_time / 4, 0.05), 1))
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+def start_fake_node(chain, host='127.0.0.1', port=0, latency=0, spike=0, spike_rate=0):
+    """
+    Start serving `chain` in a background thread, answering each request after `latency` seconds,
+    plus `spike` seconds for a `spike_rate` fraction of the requests.
+    Returns the server; its URL is http://host:server.server_port.
+    """
+    server = ThreadingHTTPServer((host, port), FakeNodeHandler)
+    server.daemon_threads = True
+    server.chain = chain
+    server.latency = latency
+    server.spike = spike
+    server.spike_rate = spike_rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def spawn_fake_node(port, *arguments):
+    """
+    Run a fake node in a separate process, so that it does not share the CPU and memory of the measured process.
+    Returns the process once the node answers.
+    """
+    process = subprocess.Popen([sys.executable, '-m', 'benchmarks.fake_node', '--port', str(port)] + [str(argument) for argument in arguments],
+                               stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'Fake node did not start on port {port}')
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def load_delegates(path):
+    if not path:
+        return []
+    with open(path, 'r') as f:
+        return [entry['address'] for entry in json.load(f)]
+
+def write_delegates(path, count):
+    """
+    Write a delegates file of `count` synthetic delegates, in the format of DELEGATES_TO_MONITOR_PARAMETER.
+    Returns their addresses.
+    """
+    delegates = [{'address': 'tz1' + base58_digest(f'monitored-{index}', 33), 'name': f'monitored-{index}'} for index in range(count)]
+    with open(path, 'w') as f:
+        json.dump(delegates, f)
+    return [entry['address'] for entry in delegates]
+
+def configure_monitor(directory, node_url, levels, delegates=10, environment=None):
+    """
+    Write directory/delegates.json with `delegates` synthetic delegates and set the environment read by main at import
+    time in `environment` (os.environ by default), for a monitor checking the last `levels` levels of node_url.
+    Alerting channels are disabled; alert thresholds already set in the environment are kept.
+    Returns the environment.
+    """
+    environment = os.environ if environment is None else environment
+    path = os.path.join(directory, 'delegates.json')
+    write_delegates(path, delegates)
+    environment.update({'RPC_URL': node_url, 'DELEGATES_TO_MONITOR_PARAMETER': path, 'BLOCK_SLIDING_WINDOW_SIZE': str(levels),
+                        'SEND_TO_CLOUDWATCH': 'false', 'SEND_TO_TELEGRAM': 'false'})
+    for name, value in (('ALERT_BAKING_THRESHOLD', 1), ('ALERT_BAKING_BLOCK_WINDOW', levels),
+                        ('ALERT_ATTESTATION_THRESHOLD', 5), ('ALERT_ATTESTATION_BLOCK_WINDOW', levels)):
+        environment.setdefault(name, str(value))
+    return environment
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a synthetic Tezos chain for the monitor.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18732)
+    parser.add_argument('--delegates', help='JSON file with the delegates to include in the committee')
+    parser.add_argument('--committee-size', type=int, default=100)
+    parser.add_argument('--attesters-per-level', type=int, default=0, help='Number of delegates with attestation rights at each level (default: all)')
+    parser.add_argument('--blocks-per-cycle', type=int, default=10800)
+    parser.add_argument('--start-level', type=int, default=1000000)
+    parser.add_argument('--block-time', type=float, default=8)
+    parser.add_argument('--miss-rate', type=float, default=0.01)
+    parser.add_argument('--aggregate-ratio', type=float, default=0.5)
+    parser.add_argument('--manager-operations', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=0, help='Delay before answering each request')
+    parser.add_argument('--spike-ms', type=float, default=0, help='Additional delay of occasional slow answers')
+    parser.add_argument('--spike-rate', type=float, default=0, help='Fraction of the requests answered with the additional delay')
+    parser.add_argument('--seed', type=int, default=0, help='Nodes with different seeds serve different chains')
+    args = parser.parse_args()
+    chain = FakeChain(load_delegates(args.delegates), committee_size=args.committee_size, blocks_per_cycle=args.blocks_per_cycle,
+                      start_level=args.start_level, block_time=args.block_time, miss_rate=args.miss_rate,
+                      aggregate_ratio=args.aggregate_ratio, manager_operations=args.manager_operations, seed=args.seed,
+                      attesters_per_level=args.attesters_per_level)
+    server = start_fake_node(chain, args.host, args.port, latency=args.latency_ms / 1000, spike=args.spike_ms / 1000,
+                             spike_rate=args.spike_rate)
+    print(f"Fake node serving on http://{args.host}:{server.server_port} from level {args.start_level}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
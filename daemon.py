@@ -0,0 +1,71 @@
+# Long-running alternative to running main.py from cron. Follows the node's head stream and processes
+# each newly finalized level as soon as it is announced, keeping the DB session, RPC pool and caches warm.
+import os
+import signal
+import time
+from main import (RIGHTS_INDEX_ENABLED, delegates, open_session, create_rpc, check_for_stale_state,
+                  get_last_processed_level, load_alert_windows, print_shard, process_up_to_level)
+from alerting.alert_manager import send_alert, send_log
+from rpc.rights_index import RightsIndex
+from metrics.exporter import start_metrics_server, write_metrics_file
+
+# Reconnect if the node announces no head for this many seconds
+DAEMON_HEAD_TIMEOUT = int(os.getenv('DAEMON_HEAD_TIMEOUT', 60))
+# Upper bound in seconds for the exponential backoff between reconnection attempts
+DAEMON_MAX_BACKOFF = int(os.getenv('DAEMON_MAX_BACKOFF', 60))
+
+def stop(signum, frame):
+    # SIGTERM (systemctl stop, docker stop) stops the daemon like Ctrl-C, so it closes cleanly and pending alerts are delivered at exit
+    raise KeyboardInterrupt
+
+def run_daemon():
+    signal.signal(signal.SIGTERM, stop)
+    print_shard()
+    start_metrics_server()
+    session = open_session()
+    rpc = create_rpc()
+    rights_index = RightsIndex(session, delegates) if RIGHTS_INDEX_ENABLED else None
+    windows = load_alert_windows(session)
+    print(f"Last processed level: {get_last_processed_level(session)}")
+    was_stale = check_for_stale_state(session)
+    backoff = 1
+    try:
+        while True:
+            try:
+                for head in rpc.monitor_heads(timeout=DAEMON_HEAD_TIMEOUT):
+                    backoff = 1
+                    # Blocks are final two levels below the head, i.e. at head~2
+                    finalized_level = head['level'] - 2
+                    if finalized_level <= get_last_processed_level(session):
+                        continue
+                    if len(rpc.pool.nodes) > 1:
+                        # Check that the nodes agree on head~2 and skip the lagging ones
+                        finalized_level = rpc.get_latest_finalized_level()
+                    else:
+                        rpc.finalized_level = finalized_level
+                    print(f"Latest finalized Tezos level: {finalized_level}")
+                    process_up_to_level(session, rpc, finalized_level, windows, rights_index)
+                    write_metrics_file()
+                    if was_stale:
+                        send_alert("Monitor has resumed processing after a stale period.")
+                        was_stale = False
+                print("Head stream closed by the node, reconnecting.")
+            except Exception as e:
+                session.rollback()
+                # The windows may hold levels that were rolled back
+                windows = load_alert_windows(session)
+                print(f"Head stream failed: {e}. Reconnecting in {backoff} s.")
+                if not was_stale:
+                    was_stale = check_for_stale_state(session)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, DAEMON_MAX_BACKOFF)
+    except KeyboardInterrupt:
+        send_log("Daemon stopped.")
+    finally:
+        rpc.print_stats()
+        rpc.cache.print_stats()
+        rpc.close()
+        session.close()
+
+if __name__ == "__main__":
+    run_daemon()
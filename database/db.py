@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer
+from sqlalchemy import create_engine, event, inspect, text, Column, Index, Integer, LargeBinary, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -9,28 +9,147 @@ class State(Base):
     id = Column(Integer, primary_key=True)
     last_processed_level = Column(Integer)
     timestamp = Column(Integer)  # Unix timestamp
+    rollup_first_level = Column(Integer)  # first level folded into cycle_rollup by the monitor; the backfill folds the levels below
 
 # table for both successful and missed blocks
 class BlockBaking(Base):
     __tablename__ = 'block_baking'
     id = Column(Integer, primary_key=True)
     block_level = Column(Integer, nullable=False)
-    delegate = Column(Integer, nullable=False)
+    delegate = Column(String, nullable=False)
     successful = Column(Integer, nullable=False)  # 1 for success, 0 for missed
     alerted = Column(Integer, nullable=False, default=0)  # 1 if alert sent, 0 otherwise
     recovered = Column(Integer, nullable=False, default=0)  # 1 if recovery alert sent, 0 otherwise
+    __table_args__ = (
+        # alert and recovery lookups filter by delegate and state, pruning by level
+        Index('ix_block_baking_delegate_successful_alerted', 'delegate', 'successful', 'alerted'),
+        Index('ix_block_baking_block_level', 'block_level'),
+    )
 
 # table for both successful and missed attestations
 class BlockAttestation(Base):
     __tablename__ = 'block_attestation'
     id = Column(Integer, primary_key=True)
     block_level = Column(Integer, nullable=False)
-    delegate = Column(Integer, nullable=False)
+    delegate = Column(String, nullable=False)
     successful = Column(Integer, nullable=False)  # 1 for success, 0 for missed
     alerted = Column(Integer, nullable=False, default=0)  # 1 if alert sent, 0 otherwise
+    __table_args__ = (
+        Index('ix_block_attestation_delegate_successful_alerted', 'delegate', 'successful', 'alerted'),
+        Index('ix_block_attestation_block_level', 'block_level'),
+    )
+
+# Round 0 baking rights and attestation rights of a monitored delegate for a cycle, as bitmaps over the levels of the cycle:
+# the right at level first_level + i is bit i % 8 of byte i // 8. Attestation rights of a level are checked in the block of the following level.
+class CycleRights(Base):
+    __tablename__ = 'cycle_rights'
+    cycle = Column(Integer, primary_key=True)
+    delegate = Column(String, primary_key=True)
+    baking = Column(LargeBinary, nullable=False)
+    attestation = Column(LargeBinary, nullable=False)
+
+# cycles whose rights are stored in cycle_rights, for the delegate set identified by delegates_fingerprint
+class IndexedCycle(Base):
+    __tablename__ = 'indexed_cycle'
+    cycle = Column(Integer, primary_key=True)
+    first_level = Column(Integer, nullable=False)
+    last_level = Column(Integer, nullable=False)
+    delegates_fingerprint = Column(String, nullable=False)
+
+# Results of historical backfills, kept apart from the live tables so they are neither pruned nor alerted on
+class ArchivedBaking(Base):
+    __tablename__ = 'archive_block_baking'
+    block_level = Column(Integer, primary_key=True)
+    delegate = Column(String, primary_key=True)
+    successful = Column(Integer, nullable=False)  # 1 for success, 0 for missed
+
+class ArchivedAttestation(Base):
+    __tablename__ = 'archive_block_attestation'
+    block_level = Column(Integer, primary_key=True)
+    delegate = Column(String, primary_key=True)
+    successful = Column(Integer, nullable=False)  # 1 for success, 0 for missed
+
+# chunks of a backfill and the last level of each written to the archive tables, for the delegate set identified by delegates_fingerprint
+class BackfillChunk(Base):
+    __tablename__ = 'backfill_chunk'
+    first_level = Column(Integer, primary_key=True)
+    last_level = Column(Integer, primary_key=True)
+    processed_level = Column(Integer, nullable=False)
+    delegates_fingerprint = Column(String, nullable=False)
+
+# Per-cycle aggregates of the live and archive tables per delegate, folded in as levels are committed, so they outlive the pruned rows.
+# A recovery is a run of misses ended by a successful right; *_streak is the run of misses still open at the last folded level.
+class CycleRollup(Base):
+    __tablename__ = 'cycle_rollup'
+    delegate = Column(String, primary_key=True)
+    cycle = Column(Integer, primary_key=True)
+    baking_rights = Column(Integer, nullable=False, default=0)
+    baking_misses = Column(Integer, nullable=False, default=0)
+    baking_recoveries = Column(Integer, nullable=False, default=0)
+    baking_longest_streak = Column(Integer, nullable=False, default=0)
+    baking_streak = Column(Integer, nullable=False, default=0)
+    attestation_rights = Column(Integer, nullable=False, default=0)
+    attestation_misses = Column(Integer, nullable=False, default=0)
+    attestation_recoveries = Column(Integer, nullable=False, default=0)
+    attestation_longest_streak = Column(Integer, nullable=False, default=0)
+    attestation_streak = Column(Integer, nullable=False, default=0)
+    __table_args__ = (
+        # reports look up the latest cycle
+        Index('ix_cycle_rollup_cycle', 'cycle'),
+    )
+
+class WriteBatch:
+    """
+    Rows produced while processing a batch of levels, inserted in bulk when the batch is committed.
+    """
+    baking_model = BlockBaking
+    attestation_model = BlockAttestation
+
+    def __init__(self):
+        self.bakings = []
+        self.attestations = []
+
+    def add_baking(self, block_level, delegate, successful):
+        self.bakings.append({'block_level': block_level, 'delegate': delegate, 'successful': successful, 'alerted': 0, 'recovered': 0})
+
+    def add_attestation(self, block_level, delegate, successful):
+        self.attestations.append({'block_level': block_level, 'delegate': delegate, 'successful': successful, 'alerted': 0})
+
+    def flush(self, session):
+        """
+        Add the pending rows to the session's transaction. Committing is left to the caller.
+        """
+        if self.bakings:
+            session.bulk_insert_mappings(self.baking_model, self.bakings)
+        if self.attestations:
+            session.bulk_insert_mappings(self.attestation_model, self.attestations)
+        self.bakings = []
+        self.attestations = []
+
+class ArchiveBatch(WriteBatch):
+    """
+    WriteBatch for the archive tables.
+    """
+    baking_model = ArchivedBaking
+    attestation_model = ArchivedAttestation
+
+    def add_baking(self, block_level, delegate, successful):
+        self.bakings.append({'block_level': block_level, 'delegate': delegate, 'successful': successful})
+
+    def add_attestation(self, block_level, delegate, successful):
+        self.attestations.append({'block_level': block_level, 'delegate': delegate, 'successful': successful})
 
 def get_engine(db_url):
-    return create_engine(db_url)
+    engine = create_engine(db_url)
+    if engine.dialect.name == 'sqlite':
+        # WAL lets readers run during writes and makes each commit much cheaper than a full journal sync
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.close()
+    return engine
 
 def get_session(engine):
     Session = sessionmaker(bind=engine)
@@ -38,3 +157,32 @@ def get_session(engine):
 
 def init_db(engine):
     Base.metadata.create_all(engine)
+    migrate(engine)
+
+def migrate(engine):
+    """
+    Bring databases created by older versions up to date: delegates used to be declared as Integer,
+    the indexes did not exist, and the state did not record the first level folded into the rollups.
+    """
+    inspector = inspect(engine)
+    if 'rollup_first_level' not in {column['name'] for column in inspector.get_columns('state')}:
+        # Levels up to the checkpoint were processed before the rollups existed
+        with engine.begin() as connection:
+            connection.execute(text('ALTER TABLE state ADD COLUMN rollup_first_level INTEGER'))
+            connection.execute(text('UPDATE state SET rollup_first_level = last_processed_level + 1'))
+    for table in (BlockBaking.__table__, BlockAttestation.__table__):
+        columns = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+        if not isinstance(columns['delegate'], Integer):
+            continue
+        print(f"Migrating table {table.name}: storing delegates as strings")
+        legacy_name = f'{table.name}_legacy'
+        column_names = ', '.join(column.name for column in table.columns)
+        selected = ', '.join('CAST(delegate AS VARCHAR)' if column.name == 'delegate' else column.name for column in table.columns)
+        with engine.begin() as connection:
+            connection.execute(text(f'ALTER TABLE {table.name} RENAME TO {legacy_name}'))
+            table.create(connection)
+            connection.execute(text(f'INSERT INTO {table.name} ({column_names}) SELECT {selected} FROM {legacy_name}'))
+            connection.execute(text(f'DROP TABLE {legacy_name}'))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
@@ -0,0 +1,121 @@
+from sqlalchemy import func, or_
+from database.db import CycleRollup
+
+KINDS = ('baking', 'attestation')
+FIELDS = ('rights', 'misses', 'recoveries', 'longest_streak', 'streak')
+
+class Cycles:
+    """
+    Maps levels to cycles from the level info of one block. Exact for the cycle of that block and the end of the
+    previous one; further levels assume that blocks_per_cycle did not change in between.
+    """
+    def __init__(self, level_info, blocks_per_cycle):
+        self.cycle = level_info['cycle']
+        self.cycle_start = level_info['level'] - level_info['cycle_position']
+        self.blocks_per_cycle = blocks_per_cycle
+
+    @classmethod
+    def from_rpc(cls, rpc, block='head'):
+        return cls(rpc.get_level_info(block), rpc.get_constants(block)['blocks_per_cycle'])
+
+    def covers(self, level):
+        """
+        True if level is in the cycle of the block the mapping was fetched from.
+        """
+        return self.cycle_start <= level < self.cycle_start + self.blocks_per_cycle
+
+    def cycle_of(self, level):
+        return self.cycle + (level - self.cycle_start) // self.blocks_per_cycle
+
+def _new_rollup(delegate, cycle):
+    # Column defaults only apply on insert, and the counters are incremented before that
+    return CycleRollup(delegate=delegate, cycle=cycle, **{f'{kind}_{field}': 0 for kind in KINDS for field in FIELDS})
+
+def _fold(rollup, kind, successful, streak):
+    """
+    Add one right of the given kind to a CycleRollup row, after a run of `streak` misses. Returns the new run length.
+    """
+    setattr(rollup, f'{kind}_rights', getattr(rollup, f'{kind}_rights') + 1)
+    if successful:
+        if streak:
+            setattr(rollup, f'{kind}_recoveries', getattr(rollup, f'{kind}_recoveries') + 1)
+        return 0
+    streak += 1
+    setattr(rollup, f'{kind}_misses', getattr(rollup, f'{kind}_misses') + 1)
+    if streak > getattr(rollup, f'{kind}_longest_streak'):
+        setattr(rollup, f'{kind}_longest_streak', streak)
+    return streak
+
+def _open_runs(session, last_cycle):
+    """
+    Rollups holding the open run of misses of each delegate and kind, up to last_cycle.
+    """
+    open_runs = {}  # (delegate, kind) -> rollup
+    for rollup in session.query(CycleRollup).filter(
+            CycleRollup.cycle <= last_cycle,
+            or_(CycleRollup.baking_streak > 0, CycleRollup.attestation_streak > 0)).order_by(CycleRollup.cycle):
+        for kind in KINDS:
+            if getattr(rollup, f'{kind}_streak'):
+                open_runs[(rollup.delegate, kind)] = rollup
+    return open_runs
+
+def fold_batch(session, batch, cycles, streaks=None, below_level=None):
+    """
+    Fold the rows of a WriteBatch into the per-cycle rollups, in the caller's transaction, so they are committed
+    together with the rows and the checkpoint. Attestations count in the cycle of the block they are checked in.
+    A run of misses still open at the end of a cycle is carried over to the next row of the delegate, so runs are
+    not split at cycle boundaries; its recovery and longest streak count in the cycle where the run ends.
+
+    The monitor keeps the open runs in the rollups. Callers folding levels out of order, like the backfill,
+    pass their own streaks dict, (delegate, kind) -> run length, and the open runs of the rollups are left alone.
+    Rows from below_level on are not folded.
+    """
+    rows = {kind: [row for row in kind_rows if below_level is None or row['block_level'] < below_level]
+            for kind, kind_rows in (('baking', batch.bakings), ('attestation', batch.attestations))}
+    levels = [row['block_level'] for kind_rows in rows.values() for row in kind_rows]
+    if not levels:
+        return
+    first_cycle, last_cycle = cycles.cycle_of(min(levels)), cycles.cycle_of(max(levels))
+    rollups = {(rollup.delegate, rollup.cycle): rollup
+               for rollup in session.query(CycleRollup).filter(CycleRollup.cycle.between(first_cycle, last_cycle))}
+    open_runs = _open_runs(session, last_cycle) if streaks is None else None
+    for kind in KINDS:
+        for row in rows[kind]:
+            key = (row['delegate'], cycles.cycle_of(row['block_level']))
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = rollups[key] = _new_rollup(*key)
+                session.add(rollup)
+            if streaks is not None:
+                streaks[(row['delegate'], kind)] = _fold(rollup, kind, row['successful'], streaks.get((row['delegate'], kind), 0))
+                continue
+            previous = open_runs.get((row['delegate'], kind))
+            streak = getattr(previous, f'{kind}_streak') if previous is not None else 0
+            if previous is not None and previous is not rollup:
+                setattr(previous, f'{kind}_streak', 0)
+            streak = _fold(rollup, kind, row['successful'], streak)
+            setattr(rollup, f'{kind}_streak', streak)
+            open_runs[(row['delegate'], kind)] = rollup if streak else None
+
+def unfold_counts(session, rows):
+    """
+    Subtract the rights and misses of already folded (cycle, delegate, successful, kind) rows from the rollups,
+    e.g. before they are replaced. Recoveries and longest streaks cannot be taken back and are kept.
+    """
+    for cycle, delegate, successful, kind in rows:
+        rollup = session.get(CycleRollup, (delegate, cycle))
+        if rollup is None:
+            continue
+        setattr(rollup, f'{kind}_rights', getattr(rollup, f'{kind}_rights') - 1)
+        if not successful:
+            setattr(rollup, f'{kind}_misses', getattr(rollup, f'{kind}_misses') - 1)
+
+def latest_cycle(session):
+    return session.query(func.max(CycleRollup.cycle)).scalar()
+
+def delegate_rollups(session, delegate, first_cycle, last_cycle):
+    """
+    Rollups of a delegate for a range of cycles, by cycle. Cycles without any right of the delegate are missing.
+    """
+    return {rollup.cycle: rollup for rollup in session.query(CycleRollup).filter(
+        CycleRollup.delegate == delegate, CycleRollup.cycle.between(first_cycle, last_cycle))}
@@ -1,11 +1,17 @@
 # First load the environment variables from .env file, since they are needed for some of the rest of the imports
 from dotenv import load_dotenv
 load_dotenv()
+import hashlib
 import os
 import time
-from rpc.rpc_client import RPC
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
+from rpc.rpc_client import DELEGATES_PER_QUERY, RPC
 from alerting.alert_manager import send_alert, send_log
-from database.db import get_engine, get_session, init_db, State, BlockBaking, BlockAttestation
+from metrics.exporter import write_metrics_file
+from metrics.registry import (STAGE_SECONDS, LEVEL_SECONDS, LEVELS_PROCESSED, FINALIZED_LEVEL, LAST_PROCESSED_LEVEL,
+                              LAG_LEVELS)
 
 # Load environment variables from .env
 
@@ -20,101 +26,283 @@ ALERT_ATTESTATION_BLOCK_WINDOW = int(os.getenv('ALERT_ATTESTATION_BLOCK_WINDOW')
 ALERT_INACTIVE_STATE_THRESHOLD = int(os.getenv('ALERT_INACTIVE_STATE_THRESHOLD', 600))  # Default to 10 minutes
 BLOCKEXPLORER_URL = os.getenv('BLOCKEXPLORER_URL', 'https://tzkt.io')
 IDENTIFIER = os.getenv('IDENTIFIER', 'tezos-monitor')
+RPC_POOL_SIZE = int(os.getenv('RPC_POOL_SIZE', 10))
+RPC_CACHE_SIZE_MB = int(os.getenv('RPC_CACHE_SIZE_MB', 64))
+CATCHUP_CONCURRENCY = int(os.getenv('CATCHUP_CONCURRENCY', 8))
+RIGHTS_INDEX_ENABLED = os.getenv('RIGHTS_INDEX_ENABLED', 'true').lower() == 'true'
+RPC_STREAM_PARSE = os.getenv('RPC_STREAM_PARSE', 'false').lower() == 'true'
+DB_BATCH_LEVELS = int(os.getenv('DB_BATCH_LEVELS', 100))
+RPC_HEDGE_PERCENTILE = float(os.getenv('RPC_HEDGE_PERCENTILE', 90))
+RPC_MAX_LAG = int(os.getenv('RPC_MAX_LAG', 2))
+RPC_DEBUG = os.getenv('RPC_DEBUG', 'false').lower() == 'true'
+# Split the delegates across SHARD_COUNT monitor processes; this one monitors shard SHARD_INDEX, with its own database
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 1))
+SHARD_INDEX = int(os.getenv('SHARD_INDEX', 0))
+if not 0 <= SHARD_INDEX < SHARD_COUNT:
+    raise ValueError(f"SHARD_INDEX must be between 0 and SHARD_COUNT - 1, got {SHARD_INDEX} for SHARD_COUNT={SHARD_COUNT}")
+
+def shard_suffix(shard_index):
+    return f'-shard{shard_index}' if SHARD_COUNT > 1 else ''
+
+def shard_db_url(shard_index):
+    return f'sqlite:///state{shard_suffix(shard_index)}.db'  # Change to PostgreSQL if needed
+
+DB_URL = shard_db_url(SHARD_INDEX)
+# Snapshot of the alert state, saved next to the database
+ALERT_WINDOW_SNAPSHOT = os.getenv('ALERT_WINDOW_SNAPSHOT', f'state_window{shard_suffix(SHARD_INDEX)}.json')
+
+def delegate_shard(address, shard_count):
+    """
+    Shard of a delegate, stable across processes and runs, unlike hash().
+    """
+    return int(hashlib.sha1(address.encode()).hexdigest(), 16) % shard_count
+
 # Load delegates from JSON file
 with open(DELEGATES_TO_MONITOR_PARAMETER, 'r') as f:
     delegates_json = json.load(f)
-delegates = [entry['address'] for entry in delegates_json]
+delegates = [entry['address'] for entry in delegates_json if delegate_shard(entry['address'], SHARD_COUNT) == SHARD_INDEX]
 delegate_names = {entry['address']: entry.get('name', entry['address']) for entry in delegates_json}
+# Hashed index of the delegates, for the membership tests done for every right of every level
+delegate_set = frozenset(delegates)
+# Rights queries of single levels are filtered by the node if the delegates fit in one query;
+# otherwise the whole committee is fetched once and matched against delegate_set
+rights_filter = delegates if len(delegates) <= DELEGATES_PER_QUERY else None
 
 # Main function to monitor delegates
+# The ORM and the modules using it are imported in the functions that need them, so that a run with nothing to do
+# exits before loading them
 
 def get_last_processed_level(session):
+    from database.db import State
     state = session.query(State).first()
     return state.last_processed_level if state else 0
 
-def save_last_processed_level(session, level):
+def set_last_processed_level(session, level, first_level=None):
+    """
+    Set the checkpoint. The first time, first_level is recorded as the first level folded into the rollups,
+    by default the level after the checkpoint.
+    """
+    from database.db import State
     now = int(time.time())
     state = session.query(State).first()
     if state:
         state.last_processed_level = level
         state.timestamp = now
     else:
-        state = State(last_processed_level=level, timestamp=now)
+        state = State(last_processed_level=level, timestamp=now, rollup_first_level=level + 1 if first_level is None else first_level)
         session.add(state)
+    LAST_PROCESSED_LEVEL.set(level)
+    LAG_LEVELS.set(max(FINALIZED_LEVEL.get() - level, 0))
+
+def peek_last_processed_level(db_url=DB_URL):
+    """
+    Last processed level read with the sqlite3 module, without loading the ORM.
+    Returns None if it cannot be read this way, e.g. for another database or before the first run.
+    """
+    if not db_url.startswith('sqlite:///'):
+        return None
+    path = db_url[len('sqlite:///'):]
+    if not os.path.exists(path):
+        return None
+    try:
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            row = connection.execute('SELECT last_processed_level FROM state LIMIT 1').fetchone()
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+def touch_state(db_url=DB_URL):
+    """
+    Refresh the timestamp of the state with the sqlite3 module, as a run that processes levels does,
+    so that a run with nothing new to process does not count as stale.
+    """
+    path = db_url[len('sqlite:///'):]
+    try:
+        connection = sqlite3.connect(path)
+        try:
+            with connection:
+                connection.execute('UPDATE state SET timestamp = ?', (int(time.time()),))
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        print(f"Refreshing the state timestamp failed: {e}")
+
+def save_last_processed_level(session, level):
+    set_last_processed_level(session, level)
     session.commit()
 
-def process_baking_rights(session, rpc, block_level, delegates):
+_cycles = None
+
+def get_cycles(rpc, level):
+    """
+    Level to cycle mapping of the rollups for a batch ending at level. It is fetched from the block at level
+    once the cached one does not cover it, so changes of blocks_per_cycle are followed.
+    Returns None if the node could not be queried.
+    """
+    global _cycles
+    if _cycles is None or not _cycles.covers(level):
+        from database.rollup import Cycles
+        try:
+            _cycles = Cycles.from_rpc(rpc, level)
+        except Exception as e:
+            print(f"Fetching the cycle of level {level} failed: {e}")
+            return None
+    return _cycles
+
+def commit_batch(session, batch, first_level, level, cycles):
+    """
+    Write the rows of the batch of levels first_level to level, their per-cycle rollups and the checkpoint
+    in a single transaction.
+    """
+    from database.rollup import fold_batch
+    with STAGE_SECONDS.time('db_write'):
+        set_last_processed_level(session, level, first_level)
+        # Take the write lock before reading the rollups, so that a backfill folding the same rows waits for this commit
+        session.flush()
+        fold_batch(session, batch, cycles)
+        batch.flush(session)
+        session.commit()
+
+def process_baking_rights(session, rpc, block_level, delegates, batch, windows, rights_index=None):
+    from alerting.alert_evaluator import mark_bakings_recovered
     try:
-        baking_opportunities = rpc.get_baking_opportunities_for_level(block_level, timeout=10)
-        baking_round0_right = baking_opportunities[0]['delegate']
+        with STAGE_SECONDS.time('rights'):
+            if rights_index is not None and rights_index.covers(block_level):
+                baking_round0_right = rights_index.get_baker(block_level)
+            else:
+                baking_rights = rpc.get_baking_rights_for_level(block_level, rights_filter, max_round=0, timeout=10)
+                baking_round0_right = baking_rights[0]['delegate'] if baking_rights else None
+        if baking_round0_right is None:
+            return
         name = delegate_names.get(baking_round0_right, baking_round0_right)
         print(f"Baking rights round 0: {name} ({baking_round0_right})")
         if baking_round0_right in delegates:
             print(f"Delegate \"{name}\" ({baking_round0_right}) has baking rights for block {block_level}")
-            block_info = rpc.get_block_info(block_level, timeout=10)
-            baker = block_info['metadata']['baker']
+            with STAGE_SECONDS.time('block'):
+                baker = rpc.get_block_baker(block_level, timeout=10)
             if baker != baking_round0_right:
                 print(f"Delegate \"{name}\" ({baking_round0_right}) has baking rights for block {block_level}, but it was baked by {baker}.")
-                block_entry = BlockBaking(block_level=block_level, delegate=baking_round0_right, successful=0, alerted=0)
-                session.add(block_entry)
-                session.commit()
+                batch.add_baking(block_level, baking_round0_right, successful=0)
+                windows.bakings.record_miss(baking_round0_right, block_level)
             else:
                 print(f"Delegate \"{name}\" ({baking_round0_right}) successfully baked block {block_level}")
-                # Check for all previous missed, alerted, unrecovered bakings for this delegate
-                missed_entries = session.query(BlockBaking).filter_by(delegate=baking_round0_right, successful=0, alerted=1, recovered=0).order_by(BlockBaking.block_level.asc()).all()
-                if missed_entries:
-                    first_missed = missed_entries[0]
-                    last_missed = missed_entries[-1]
+                # Recover from the previous missed, alerted bakings of this delegate, and mark them as recovered in the history
+                if windows.bakings.recover(baking_round0_right):
                     send_alert(f"Delegate {name} ({baking_round0_right}) has successfully baked block {block_level} after missing blocks.")
-                    for entry in missed_entries:
-                        entry.recovered = 1
-                    session.commit()
-                block_entry = BlockBaking(block_level=block_level, delegate=baking_round0_right, successful=1, alerted=0)
-                session.add(block_entry)
-                session.commit()
+                    with STAGE_SECONDS.time('db_write'):
+                        mark_bakings_recovered(session, baking_round0_right)
+                batch.add_baking(block_level, baking_round0_right, successful=1)
     except Exception as e:
         send_alert(f"RPC error or timeout while processing baking rights for block {block_level}: {e}")
         # Optionally: return, break, or continue
         return
 
-def process_attestation_rights(session, rpc, block_level, delegates):
+def process_attestation_rights(session, rpc, block_level, delegates, batch, windows, rights_index=None):
     try:
-        attestation_opportunities = rpc.get_attestation_opportunities_for_level(block_level, timeout=10)
-        for attestation_opportunity in attestation_opportunities:
-            attestation_delegate = attestation_opportunity['delegate']
-            name = delegate_names.get(attestation_delegate, attestation_delegate)
-            if attestation_delegate in delegates:
+        with STAGE_SECONDS.time('rights'):
+            if rights_index is not None and rights_index.covers(block_level):
+                attestation_delegates = rights_index.get_attesters(block_level)
+            else:
+                attestation_rights = rpc.get_attestation_rights_for_level(block_level, rights_filter, timeout=10)
+                attestation_delegates = [attestation_right['delegate'] for attestation_right in attestation_rights]
+            attestation_delegates = [delegate for delegate in attestation_delegates if delegate in delegates]
+        # The attestations are only downloaded and analysed once, and only if one of the delegates had attestation rights
+        if not attestation_delegates:
+            return
+        with STAGE_SECONDS.time('block'):
+            attesters = rpc.get_block_attesters(block_level, timeout=10)
+        with STAGE_SECONDS.time('matching'):
+            for attestation_delegate in attestation_delegates:
+                name = delegate_names.get(attestation_delegate, attestation_delegate)
                 print(f"Delegate \"{name}\"s ({attestation_delegate}) has attestation rights for block {block_level}")
-                block_info = rpc.get_block_info(block_level, timeout=10)
-                operations = block_info['operations']
-                attested = False
-                for attestation in operations[0]:
-                    for content in attestation['contents']:
-                        if (content['kind'] == 'attestation_with_dal' or content['kind'] == 'attestation') and content['metadata']['delegate'] == attestation_delegate:
-                            print(f"Delegate \"{name}\" ({attestation_delegate}) successfully attested block {block_level}")
-                            attested = True
-                            break
-                        if content['kind'] == 'attestations_aggregate':
-                            for committee in content['metadata']['committee']:
-                                if committee['delegate'] == attestation_delegate:
-                                    print(f"Delegate \"{name}\" ({attestation_delegate}) successfully attested block {block_level}")
-                                    attested = True
-                                    break
-                if attested:
-                    block_entry = BlockAttestation(block_level=block_level, delegate=attestation_delegate, successful=1, alerted=0)
+                if attestation_delegate in attesters:
+                    print(f"Delegate \"{name}\" ({attestation_delegate}) successfully attested block {block_level}")
+                    batch.add_attestation(block_level, attestation_delegate, successful=1)
                 else:
                     send_log(f"Delegate {name} ({attestation_delegate}) did NOT attest block {block_level}")
-                    block_entry = BlockAttestation(block_level=block_level, delegate=attestation_delegate, successful=0, alerted=0)
-                session.add(block_entry)
-                session.commit()
+                    batch.add_attestation(block_level, attestation_delegate, successful=0)
+                    windows.attestations.record_miss(attestation_delegate, block_level)
     except Exception as e:
         send_alert(f"RPC error or timeout while processing attestation rights for block {block_level}: {e}")
         return
 
+def prefetch_level(rpc, block_level, delegates, rights_index=None):
+    """
+    Warm the RPC cache with the rights of a level and, for the rights of the delegates, the baker or the attesters.
+    Errors are only printed here; they are reported when the level is processed.
+    """
+    try:
+        if rights_index is not None and rights_index.covers(block_level):
+            has_baking_right = rights_index.get_baker(block_level) is not None
+            has_attestation_right = bool(rights_index.get_attesters(block_level))
+        else:
+            baking_rights = rpc.get_baking_rights_for_level(block_level, rights_filter, max_round=0, timeout=10)
+            attestation_rights = rpc.get_attestation_rights_for_level(block_level, rights_filter, timeout=10)
+            has_baking_right = bool(baking_rights) and baking_rights[0]['delegate'] in delegates
+            has_attestation_right = any(attestation_right['delegate'] in delegates for attestation_right in attestation_rights)
+        if has_baking_right:
+            rpc.get_block_baker(block_level, timeout=10)
+        if has_attestation_right:
+            rpc.get_block_attesters(block_level, timeout=10)
+    except Exception as e:
+        print(f"Prefetching block {block_level} failed: {e}")
+
+def process_levels(session, rpc, start_block, end_block, delegates, concurrency, windows, rights_index=None):
+    """
+    Process the levels from start_block to end_block in order. The results of every DB_BATCH_LEVELS levels
+    are committed together with the checkpoint, and the alert windows saved for it, so an interrupted run
+    resumes after the last committed batch.
+    Up to `concurrency` levels ahead are fetched in parallel into the RPC cache.
+    Levels covered by the rights index are only downloaded if one of the delegates has a right.
+    If the cycles of a batch cannot be fetched, the run stops before it, and the next run resumes there.
+    Returns the last level processed.
+    """
+    from database.db import WriteBatch
+    started = time.perf_counter()
+    processed = 0
+    last_level = end_block
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        prefetches = deque()
+        next_level = start_block
+        batch = WriteBatch()
+        batch_start = start_block
+        for block_level in range(start_block, end_block + 1):
+            if block_level == batch_start:
+                # Fetched before the batch changes the alert windows, which only hold committed levels
+                cycles = get_cycles(rpc, min(batch_start + DB_BATCH_LEVELS - 1, end_block))
+                if cycles is None:
+                    print(f"Stopping before level {batch_start}, the cycle rollups cannot be updated.")
+                    last_level = batch_start - 1
+                    break
+            while next_level <= end_block and len(prefetches) < concurrency:
+                prefetches.append(executor.submit(prefetch_level, rpc, next_level, delegates, rights_index))
+                next_level += 1
+            with LEVEL_SECONDS.time():
+                if prefetches:
+                    with STAGE_SECONDS.time('prefetch_wait'):
+                        prefetches.popleft().result()
+                print("Processing block:", block_level)
+                process_baking_rights(session, rpc, block_level, delegates, batch, windows, rights_index)
+                process_attestation_rights(session, rpc, block_level, delegates, batch, windows, rights_index)
+                if block_level == end_block or (block_level - start_block + 1) % DB_BATCH_LEVELS == 0:
+                    commit_batch(session, batch, batch_start, block_level, cycles)
+                    batch_start = block_level + 1
+                    windows.save(ALERT_WINDOW_SNAPSHOT, block_level)
+            LEVELS_PROCESSED.inc()
+            processed += 1
+    elapsed = time.perf_counter() - started
+    if processed:
+        print(f"Processed {processed} levels in {elapsed:.2f} s ({processed / elapsed:.2f} levels/s)")
+    return last_level
+
 def remove_entries_from_block_baking(session, current_block_level, window_blocks):
     """
     Remove entries from block_baking older than current_block_level - window_blocks.
     """
+    from database.db import BlockBaking
     cutoff_level = current_block_level - window_blocks
     deleted = session.query(BlockBaking).filter(BlockBaking.block_level < cutoff_level).delete()
     session.commit()
@@ -124,96 +312,169 @@ def remove_entries_from_block_attestations(session, current_block_level, window_
     """
     Remove entries from block_attestation older than current_block_level - window_blocks.
     """
+    from database.db import BlockAttestation
     cutoff_level = current_block_level - window_blocks
     deleted = session.query(BlockAttestation).filter(BlockAttestation.block_level < cutoff_level).delete()
     session.commit()
     print(f"Removed {deleted} entries from block_attestation older than block level {cutoff_level}.")
 
-def check_for_baking_alerts(session, delegates, threshold):
+def check_for_baking_alerts(session, windows, delegates, threshold):
     """
-    Checks if missed bakings in block_baking table meet or exceed threshold.s
+    Checks if missed bakings within the alert window meet or exceed threshold.
     Sends alert if so.
     """
+    from alerting.alert_evaluator import mark_alerted
+    from database.db import BlockBaking
+    # Only count missed bakings that have not been alerted
+    crossings = windows.bakings.threshold_crossings(delegates, threshold)
     for delegate in delegates:
-        name = delegate_names.get(delegate, delegate)
-        link = f"{BLOCKEXPLORER_URL}/{delegate}/schedule"
-        # Only count missed bakings that have not been alerted
-        missed_unalerted = session.query(BlockBaking).filter_by(delegate=delegate, successful=0, alerted=0).all()
-        missed_count = len(missed_unalerted)
-        if missed_count >= threshold:
-            send_alert(f"!!! Delegate \"{name}\" ({delegate}) missed {missed_count} new bakings (threshold: {threshold}) within the last {ALERT_BAKING_BLOCK_WINDOW} blocks! [tzkt.io link]({link})")
-            # Mark these as alerted
-            for entry in missed_unalerted:
-                entry.alerted = 1
-            session.commit()
-
-def check_for_attestation_alerts(session, delegates, threshold):
-    """
-    Checks if missed attestations in block_attestation table meet or exceed threshold.
+        if delegate in crossings:
+            name = delegate_names.get(delegate, delegate)
+            link = f"{BLOCKEXPLORER_URL}/{delegate}/schedule"
+            send_alert(f"!!! Delegate \"{name}\" ({delegate}) missed {crossings[delegate]} new bakings (threshold: {threshold}) within the last {ALERT_BAKING_BLOCK_WINDOW} blocks! [tzkt.io link]({link})")
+    # Mark these as alerted, in the window and in the history
+    windows.bakings.mark_alerted(crossings)
+    mark_alerted(session, BlockBaking, crossings)
+    session.commit()
+
+def check_for_attestation_alerts(session, windows, delegates, threshold):
+    """
+    Checks if missed attestations within the alert window meet or exceed threshold.
     Sends alert if so.
     """
+    from alerting.alert_evaluator import mark_alerted
+    from database.db import BlockAttestation
+    # Only count missed attestations that have not been alerted
+    crossings = windows.attestations.threshold_crossings(delegates, threshold)
     for delegate in delegates:
-        name = delegate_names.get(delegate, delegate)
-        link = f"{BLOCKEXPLORER_URL}/{delegate}/schedule"
-        # Only count missed attestations that have not been alerted
-        missed_unalerted = session.query(BlockAttestation).filter_by(delegate=delegate, successful=0, alerted=0).all()
-        missed_count = len(missed_unalerted)
-        if missed_count >= threshold:
-            send_alert(f"!!! Delegate \"{name}\" ({delegate}) missed {missed_count} new attestations (threshold: {threshold}) within the last {ALERT_ATTESTATION_BLOCK_WINDOW} blocks! [tzkt.io link]({link})")
-            # Mark these as alerted
-            for entry in missed_unalerted:
-                entry.alerted = 1
-            session.commit()
+        if delegate in crossings:
+            name = delegate_names.get(delegate, delegate)
+            link = f"{BLOCKEXPLORER_URL}/{delegate}/schedule"
+            send_alert(f"!!! Delegate \"{name}\" ({delegate}) missed {crossings[delegate]} new attestations (threshold: {threshold}) within the last {ALERT_ATTESTATION_BLOCK_WINDOW} blocks! [tzkt.io link]({link})")
+    # Mark these as alerted, in the window and in the history
+    windows.attestations.mark_alerted(crossings)
+    mark_alerted(session, BlockAttestation, crossings)
+    session.commit()
 
-def main():
-    # Database setup
-    db_url = 'sqlite:///state.db'  # Change to PostgreSQL if needed
+def open_session(db_url=DB_URL):
+    from database.db import get_engine, get_session, init_db
     engine = get_engine(db_url)
     init_db(engine)
-    session = get_session(engine)
+    return get_session(engine)
 
-    # Initialize RPC client
-    rpc = RPC(node_url=RPC_URL)
-
-    # Get last processed level from DB
-    last_processed_level = get_last_processed_level(session)
-    print(f"Last processed level: {last_processed_level}")
+def create_rpc():
+    return RPC(node_url=RPC_URL, pool_size=max(RPC_POOL_SIZE, CATCHUP_CONCURRENCY), cache_max_bytes=RPC_CACHE_SIZE_MB * 1024 * 1024,
+               stream_parse=RPC_STREAM_PARSE, hedge_percentile=RPC_HEDGE_PERCENTILE, max_lag=RPC_MAX_LAG, debug=RPC_DEBUG)
 
-    # Check for staled state
+def check_for_stale_state(session):
+    """
+    Sends an alert if the last processed level is older than ALERT_INACTIVE_STATE_THRESHOLD. Returns True if so.
+    """
+    from database.db import State
     state = session.query(State).first()
-    was_stale = False
     if state and state.timestamp:
         now = int(time.time())
         age = now - state.timestamp
         if age > ALERT_INACTIVE_STATE_THRESHOLD:
             send_alert(f"!!! Staled! Last processed timestamp is {age} seconds old.")
-            was_stale = True
+            return True
     else:
         print("No timestamp found in state table.")
+    return False
 
-    # Get latest finalized level
-    latest_finalized_level = rpc.get_latest_finalized_level()
-    print(f"Latest finalized Tezos level: {latest_finalized_level}")
+def load_alert_windows(session):
+    """
+    Load the alert windows from their snapshot, or rebuild them from the database if the snapshot is missing
+    or was not saved for the last processed level, e.g. after a crash between a commit and the snapshot.
+    """
+    from alerting.alert_window import AlertWindows
+    windows = AlertWindows.load(ALERT_WINDOW_SNAPSHOT, get_last_processed_level(session))
+    if windows is None:
+        print(f"No alert window snapshot for the last processed level in {ALERT_WINDOW_SNAPSHOT}, rebuilding it from the database.")
+        windows = AlertWindows.from_database(session)
+    return windows
+
+def process_up_to_level(session, rpc, latest_finalized_level, windows, rights_index=None):
+    """
+    Process all levels after the last processed level up to latest_finalized_level, then check for alerts.
+    """
+    last_processed_level = get_last_processed_level(session)
+    FINALIZED_LEVEL.set(latest_finalized_level)
+    LAST_PROCESSED_LEVEL.set(last_processed_level)
+    LAG_LEVELS.set(max(latest_finalized_level - last_processed_level, 0))
 
     remove_entries_from_block_baking(session, latest_finalized_level, ALERT_BAKING_BLOCK_WINDOW)
     remove_entries_from_block_attestations(session, latest_finalized_level, ALERT_ATTESTATION_BLOCK_WINDOW)
+    windows.bakings.trim(latest_finalized_level - ALERT_BAKING_BLOCK_WINDOW)
+    windows.attestations.trim(latest_finalized_level - ALERT_ATTESTATION_BLOCK_WINDOW)
 
     start_block = latest_finalized_level - int(BLOCK_SLIDING_WINDOW_SIZE) + 1
     if start_block < last_processed_level:
         start_block = last_processed_level + 1
         print("Start block set to last_processed_level:", last_processed_level)
 
-    for block_level in range(start_block, latest_finalized_level + 1):
-        print("Processing block:", block_level)
-        process_baking_rights(session, rpc, block_level, delegates)
-        process_attestation_rights(session, rpc, block_level, delegates)
+    # Index the rights of the monitored delegates for whole cycles, so levels without rights need no RPC
+    if rights_index is not None:
+        rights_index.prune(start_block - 1)
+        try:
+            rights_index.prefetch(rpc, start_block, latest_finalized_level)
+        except Exception as e:
+            print(f"Prefetching cycle rights failed, falling back to per-level rights queries: {e}")
+
+    last_level = process_levels(session, rpc, start_block, latest_finalized_level, delegate_set, CATCHUP_CONCURRENCY, windows, rights_index)
+
+    check_for_baking_alerts(session, windows, delegates, ALERT_BAKING_THRESHOLD)
+    check_for_attestation_alerts(session, windows, delegates, ALERT_ATTESTATION_THRESHOLD)
+    save_last_processed_level(session, last_level)
+    windows.save(ALERT_WINDOW_SNAPSHOT, last_level)
+
+def print_shard():
+    if SHARD_COUNT > 1:
+        print(f"Shard {SHARD_INDEX} of {SHARD_COUNT}: monitoring {len(delegates)} of {len(delegates_json)} delegates")
+
+def main():
+    print_shard()
+
+    # Initialize RPC client
+    rpc = create_rpc()
+
+    # Get latest finalized level
+    latest_finalized_level = rpc.get_latest_finalized_level()
+    print(f"Latest finalized Tezos level: {latest_finalized_level}")
+
+    # Exit before opening the database if nothing was finalized since the last run
+    checkpoint = peek_last_processed_level()
+    if checkpoint is not None and latest_finalized_level <= checkpoint:
+        print(f"No new finalized level since the last processed level {checkpoint}.")
+        touch_state()
+        FINALIZED_LEVEL.set(latest_finalized_level)
+        LAST_PROCESSED_LEVEL.set(checkpoint)
+        LAG_LEVELS.set(0)
+        rpc.close()
+        write_metrics_file()
+        return
+
+    # Database setup
+    session = open_session()
+
+    # Get last processed level from DB
+    last_processed_level = get_last_processed_level(session)
+    print(f"Last processed level: {last_processed_level}")
+
+    # Check for staled state
+    was_stale = check_for_stale_state(session)
 
-    check_for_baking_alerts(session, delegates, ALERT_BAKING_THRESHOLD)
-    check_for_attestation_alerts(session, delegates, ALERT_ATTESTATION_THRESHOLD)
-    save_last_processed_level(session, latest_finalized_level)
+    from rpc.rights_index import RightsIndex
+    rights_index = RightsIndex(session, delegates) if RIGHTS_INDEX_ENABLED else None
+    windows = load_alert_windows(session)
+    process_up_to_level(session, rpc, latest_finalized_level, windows, rights_index)
     send_log("All blocks processed. Last processed level saved to database.")
     if was_stale:
         send_alert("Monitor has resumed processing after a stale period.")
+    rpc.print_stats()
+    rpc.cache.print_stats()
+    rpc.close()
+    write_metrics_file()
 
 if __name__ == "__main__":
     main()
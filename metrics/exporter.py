@@ -0,0 +1,45 @@
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from metrics.registry import REGISTRY, METRICS_FILE, METRICS_PORT
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+def write_metrics_file(path=METRICS_FILE):
+    """
+    Write the metrics to `path`, e.g. for the node_exporter textfile collector. Does nothing if no path is configured.
+    The file is replaced atomically, so readers never see a partial file.
+    """
+    if not path:
+        return
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w') as f:
+        f.write(REGISTRY.render())
+    os.replace(temporary_path, path)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        data = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """
+    Serve the metrics on http://host:port/metrics from a background thread. Returns the server, or None if no port is configured.
+    """
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    print(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+
+# Metrics are collected only if they are exported, to a file and/or over HTTP
+METRICS_FILE = os.getenv('METRICS_FILE')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_ENABLED = bool(METRICS_FILE or METRICS_PORT)
+
+# Upper bounds in seconds of the histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.enabled = METRICS_ENABLED
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.extend(self._render_sample(labels, value))
+        return lines
+
+    def _render_sample(self, labels, value):
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}']
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+class Histogram(_Metric):
+    """
+    Cumulative histogram of observed values, e.g. durations in seconds.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # One count per bucket, then the sum and count of all observations
+                entry = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def time(self, *labels):
+        """
+        Context manager observing the duration of its block. A shared no-op when metrics are disabled.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def _render_sample(self, labels, entry):
+        lines = [f'{self.name}_bucket{_format_labels(self.labelnames, labels, [("le", _format_value(float(bound)))])} {count}'
+                 for bound, count in zip(self.buckets, entry)]
+        lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, [("le", "+Inf")])} {entry[-1]}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(entry[-2])}')
+        lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {entry[-1]}')
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Return all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+RPC_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'tezos_monitor_rpc_request_seconds', 'Latency of RPC requests, including retries, per endpoint type.', ['endpoint']))
+RPC_RETRIES = REGISTRY.register(Counter(
+    'tezos_monitor_rpc_retries_total', 'RPC requests retried after a connection error or a 5xx response, per endpoint type.', ['endpoint']))
+RPC_ERRORS = REGISTRY.register(Counter(
+    'tezos_monitor_rpc_errors_total', 'RPC requests that failed after all retries, per endpoint type.', ['endpoint']))
+RPC_NODE_FAILURES = REGISTRY.register(Counter(
+    'tezos_monitor_rpc_node_failures_total', 'Requests to an RPC node that failed and were sent to another node, per node.', ['node']))
+RPC_HEDGED_REQUESTS = REGISTRY.register(Counter(
+    'tezos_monitor_rpc_hedged_requests_total', 'Requests also sent to a second RPC node because the first one was slow, per node that answered first.', ['winner']))
+RPC_NODE_FINALIZED_LEVEL = REGISTRY.register(Gauge(
+    'tezos_monitor_rpc_node_finalized_level', 'Finalized level (head~2) reported by each RPC node.', ['node']))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'tezos_monitor_stage_seconds', 'Time spent per level in each processing stage: prefetch_wait, rights, block, matching, db_write.', ['stage']))
+LEVEL_SECONDS = REGISTRY.register(Histogram(
+    'tezos_monitor_level_seconds', 'Total time spent processing a level.'))
+LEVELS_PROCESSED = REGISTRY.register(Counter(
+    'tezos_monitor_levels_processed_total', 'Levels processed.'))
+ALERT_DISPATCH_SECONDS = REGISTRY.register(Histogram(
+    'tezos_monitor_alert_dispatch_seconds', 'Time from raising an alert or log message to its delivery, per channel.', ['channel'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)))
+ALERT_DISPATCH_FAILURES = REGISTRY.register(Counter(
+    'tezos_monitor_alert_dispatch_failures_total', 'Failed deliveries of alerts and log messages, per channel.', ['channel']))
+FINALIZED_LEVEL = REGISTRY.register(Gauge(
+    'tezos_monitor_finalized_level', 'Latest finalized level (head~2) seen.'))
+LAST_PROCESSED_LEVEL = REGISTRY.register(Gauge(
+    'tezos_monitor_last_processed_level', 'Last level processed and committed.'))
+LAG_LEVELS = REGISTRY.register(Gauge(
+    'tezos_monitor_lag_levels', 'Number of finalized levels not processed yet.'))
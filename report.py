@@ -0,0 +1,50 @@
+# Uptime report of a delegate over the last cycles, read from the per-cycle rollups only, so it stays fast
+# however much chain history has been processed.
+import argparse
+import sys
+from main import SHARD_COUNT, delegate_names, delegate_shard, open_session, shard_db_url
+from database.rollup import KINDS, delegate_rollups, latest_cycle
+
+def uptime(rights, misses):
+    return f"{100 * (rights - misses) / rights:.2f}%" if rights else '-'
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the uptime of a delegate over the last cycles.')
+    parser.add_argument('delegate', help='Address of the delegate')
+    parser.add_argument('--cycles', type=int, default=10, help='Number of cycles, up to the last cycle processed (default: 10)')
+    args = parser.parse_args()
+
+    # The delegate is stored in the database of its shard
+    session = open_session(shard_db_url(delegate_shard(args.delegate, SHARD_COUNT)))
+    last_cycle = latest_cycle(session)
+    if last_cycle is None:
+        print("No cycle has been processed yet.")
+        return 1
+    first_cycle = last_cycle - args.cycles + 1
+    rollups = delegate_rollups(session, args.delegate, first_cycle, last_cycle)
+    session.close()
+
+    name = delegate_names.get(args.delegate, args.delegate)
+    print(f"Delegate \"{name}\" ({args.delegate}), cycles {first_cycle} to {last_cycle}")
+    print(f"{'cycle':>7} {'bakings':>9} {'missed':>7} {'uptime':>8} {'attestations':>13} {'missed':>7} {'uptime':>8} {'longest miss streak':>20} {'recoveries':>11}")
+    totals = {f'{kind}_{field}': 0 for kind in KINDS for field in ('rights', 'misses', 'recoveries')}
+    longest = 0
+    for cycle in range(first_cycle, last_cycle + 1):
+        rollup = rollups.get(cycle)
+        if rollup is None:
+            print(f"{cycle:>7} {'no rights or not processed':>26}")
+            continue
+        for field in totals:
+            totals[field] += getattr(rollup, field)
+        cycle_longest = max(rollup.baking_longest_streak, rollup.attestation_longest_streak)
+        longest = max(longest, cycle_longest)
+        print(f"{cycle:>7} {rollup.baking_rights:>9} {rollup.baking_misses:>7} {uptime(rollup.baking_rights, rollup.baking_misses):>8} "
+              f"{rollup.attestation_rights:>13} {rollup.attestation_misses:>7} {uptime(rollup.attestation_rights, rollup.attestation_misses):>8} "
+              f"{cycle_longest:>20} {rollup.baking_recoveries + rollup.attestation_recoveries:>11}")
+    print(f"{'total':>7} {totals['baking_rights']:>9} {totals['baking_misses']:>7} {uptime(totals['baking_rights'], totals['baking_misses']):>8} "
+          f"{totals['attestation_rights']:>13} {totals['attestation_misses']:>7} {uptime(totals['attestation_rights'], totals['attestation_misses']):>8} "
+          f"{longest:>20} {totals['baking_recoveries'] + totals['attestation_recoveries']:>11}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import deque
+
+# Weight of the latest request in the latency estimate of an endpoint type
+LATENCY_SMOOTHING = 0.2
+# Number of recent latencies kept per endpoint type, and needed before hedging on their percentile
+LATENCY_SAMPLES = 200
+MIN_HEDGE_SAMPLES = 20
+
+class Node:
+    """
+    Health and latency of one RPC node, tracked per endpoint type.
+    """
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.latency = {}  # endpoint type -> smoothed latency in seconds
+        self.samples = {}  # endpoint type -> recent latencies in seconds
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.lagging = False
+        self.finalized_level = None
+
+    def healthy(self, now):
+        return not self.lagging and now >= self.unhealthy_until
+
+    def estimate(self, key):
+        # Endpoints never measured come first, so that every node gets measured
+        return self.latency.get(key, 0.0)
+
+class NodePool:
+    """
+    Routes each request to the fastest healthy node for its endpoint type.
+    A node is skipped for `cooldown` seconds after a failure, and while it lags behind the others.
+    """
+    def __init__(self, urls, hedge_percentile=90, default_hedge_delay=1.0, cooldown=30, max_lag=2):
+        self.nodes = [Node(url) for url in urls]
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.cooldown = cooldown
+        self.max_lag = max_lag
+        self._lock = threading.Lock()
+
+    def ranked(self, key):
+        """
+        Nodes in the order to try them for an endpoint type: healthy ones by latency, then the others.
+        """
+        now = time.monotonic()
+        with self._lock:
+            healthy = sorted((node for node in self.nodes if node.healthy(now)), key=lambda node: node.estimate(key))
+            others = sorted((node for node in self.nodes if not node.healthy(now)), key=lambda node: (node.lagging, node.unhealthy_until))
+        return healthy + others
+
+    def record_success(self, node, key, elapsed):
+        with self._lock:
+            node.requests += 1
+            node.consecutive_failures = 0
+            node.unhealthy_until = 0.0
+            previous = node.latency.get(key)
+            node.latency[key] = elapsed if previous is None else previous + LATENCY_SMOOTHING * (elapsed - previous)
+            node.samples.setdefault(key, deque(maxlen=LATENCY_SAMPLES)).append(elapsed)
+
+    def record_failure(self, node):
+        with self._lock:
+            node.requests += 1
+            node.failures += 1
+            node.consecutive_failures += 1
+            node.unhealthy_until = time.monotonic() + self.cooldown
+
+    def hedge_delay(self, node, key):
+        """
+        Seconds to wait for `node` before sending the same request to another node: the hedge_percentile of its recent latencies.
+        """
+        with self._lock:
+            samples = sorted(node.samples.get(key, ()))
+        if len(samples) < MIN_HEDGE_SAMPLES:
+            return self.default_hedge_delay
+        return samples[min(int(len(samples) * self.hedge_percentile / 100), len(samples) - 1)]
+
+    def update_finalized_levels(self, levels):
+        """
+        Record the head~2 level reported by each node, as a dict node -> level. Nodes more than max_lag levels
+        behind the most advanced one are marked as lagging. Returns the highest level.
+        """
+        highest = max(levels.values())
+        with self._lock:
+            for node in self.nodes:
+                level = levels.get(node)
+                if level is not None:
+                    node.finalized_level = level
+                    node.lagging = highest - level > self.max_lag
+        return highest
+
+    def print_stats(self):
+        for node in self.nodes:
+            state = 'lagging' if node.lagging else ('healthy' if node.healthy(time.monotonic()) else 'unhealthy')
+            print(f"RPC node {node.url}: {node.requests} requests, {node.failures} failures, {state}, finalized level {node.finalized_level}")
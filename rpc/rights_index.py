@@ -0,0 +1,199 @@
+import hashlib
+from database.db import CycleRights, IndexedCycle
+from rpc.rpc_client import DELEGATES_PER_QUERY, LEVELS_PER_QUERY
+
+def delegates_fingerprint(delegates):
+    return hashlib.sha1(','.join(sorted(delegates)).encode()).hexdigest()
+
+def collect_rights(rights, baking_rights, attestation_rights):
+    """
+    Add the round 0 baking rights and the attestation rights of RPC responses to rights,
+    a dict (level, delegate) -> [baking, attestation].
+    """
+    for baking_right in baking_rights:
+        if baking_right['round'] == 0:
+            rights.setdefault((baking_right['level'], baking_right['delegate']), [0, 0])[0] = 1
+    for level_rights in attestation_rights:
+        for attestation_right in level_rights['delegates']:
+            rights.setdefault((level_rights['level'], attestation_right['delegate']), [0, 0])[1] = 1
+
+# Offsets of the bits set in each byte value
+_SET_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+def encode_levels(levels, first_level, last_level):
+    """
+    Bitmap of the given levels of the range first_level to last_level.
+    Raises ValueError if a level is outside the range.
+    """
+    bitmap = bytearray((last_level - first_level + 8) // 8)
+    for level in levels:
+        if not first_level <= level <= last_level:
+            raise ValueError(f"Level {level} is outside of the bitmap range {first_level} to {last_level}")
+        offset = level - first_level
+        bitmap[offset >> 3] |= 1 << (offset & 7)
+    return bytes(bitmap)
+
+def decode_levels(bitmap, first_level, low_level, high_level):
+    """
+    Levels between low_level and high_level whose bit is set in a bitmap starting at first_level.
+    Only the bytes of the requested levels are read, and zero bytes are skipped.
+    """
+    low = max(low_level - first_level, 0)
+    high = min(high_level - first_level, 8 * len(bitmap) - 1)
+    for index in range(low >> 3, (high >> 3) + 1 if high >= low else 0):
+        for bit in _SET_BITS[bitmap[index]]:
+            offset = 8 * index + bit
+            if low <= offset <= high:
+                yield first_level + offset
+
+class RightsIndex:
+    """
+    Local index of the round 0 baking rights and the attestation rights of the monitored delegates.
+    Rights are fetched in bulk per cycle and stored in the cycle_rights table as one pair of bitmaps per delegate
+    and cycle, so they survive restarts. Only the levels of the current run are decoded in memory, by prefetch.
+    Levels are indexed by the level of the right; attestation rights of level L are checked in block L + 1.
+    """
+    def __init__(self, session, delegates):
+        self.session = session
+        self.delegates = list(delegates)
+        self.fingerprint = delegates_fingerprint(self.delegates)
+        self.cycles = {}  # cycle -> (first_level, last_level)
+        self.loaded = None  # (first_level, last_level) of the levels decoded in bakers and attesters
+        self.bakers = {}  # level -> monitored delegate with the round 0 baking right
+        self.attesters = {}  # level -> monitored delegates with attestation rights
+        self._load()
+
+    def _load(self):
+        for indexed in self.session.query(IndexedCycle).all():
+            if indexed.delegates_fingerprint == self.fingerprint:
+                self.cycles[indexed.cycle] = (indexed.first_level, indexed.last_level)
+            else:
+                # The monitored delegates changed since this cycle was indexed
+                self._delete_cycle(indexed.cycle)
+        self.session.commit()
+
+    def _delete_cycle(self, cycle):
+        self.session.query(CycleRights).filter_by(cycle=cycle).delete(synchronize_session=False)
+        self.session.query(IndexedCycle).filter_by(cycle=cycle).delete(synchronize_session=False)
+
+    def covers(self, block_level):
+        """
+        True if both the baking rights of block_level and the attestation rights checked in it are loaded.
+        """
+        return self.loaded is not None and self.loaded[0] <= block_level - 1 and block_level <= self.loaded[1]
+
+    def get_baker(self, block_level):
+        return self.bakers.get(block_level)
+
+    def get_attesters(self, block_level):
+        return sorted(self.attesters.get(block_level - 1, ()))
+
+    def prefetch(self, rpc, first_block_level, last_block_level):
+        """
+        Index the cycles covering the given block levels, plus the current and the next cycle,
+        then load the rights of these block levels.
+        """
+        covered = all(any(first_level <= level <= last_level for first_level, last_level in self.cycles.values())
+                      for level in (first_block_level - 1, last_block_level))
+        if not (covered and any(first_level > last_block_level for first_level, _ in self.cycles.values())):
+            level_info = rpc.get_level_info()
+            blocks_per_cycle = rpc.get_constants()['blocks_per_cycle']
+            current_cycle = level_info['cycle']
+            current_cycle_start = level_info['level'] - level_info['cycle_position']
+
+            def cycle_of(level):
+                return current_cycle + (level - current_cycle_start) // blocks_per_cycle
+
+            cycles = set(range(cycle_of(first_block_level - 1), cycle_of(last_block_level) + 1))
+            cycles.update((current_cycle, current_cycle + 1))
+            for cycle in sorted(cycles - set(self.cycles)):
+                first_level = current_cycle_start + (cycle - current_cycle) * blocks_per_cycle
+                self._index_cycle(rpc, cycle, first_level, first_level + blocks_per_cycle - 1)
+        self._load_levels(first_block_level - 1, last_block_level)
+
+    def _index_cycle(self, rpc, cycle, first_level, last_level):
+        print(f"Indexing rights of cycle {cycle} (levels {first_level} to {last_level})")
+        rights = {}
+        for i in range(0, len(self.delegates), DELEGATES_PER_QUERY):
+            chunk = self.delegates[i:i + DELEGATES_PER_QUERY]
+            collect_rights(rights, rpc.get_baking_rights_for_cycle(cycle, chunk, max_round=0),
+                           rpc.get_attestation_rights_for_cycle(cycle, chunk))
+        levels = {}  # delegate -> ([baking levels], [attestation levels])
+        for (level, delegate), (baking, attestation) in rights.items():
+            delegate_levels = levels.setdefault(delegate, ([], []))
+            if baking:
+                delegate_levels[0].append(level)
+            if attestation:
+                delegate_levels[1].append(level)
+        # Encoded before the old rows are deleted, so rights outside of the cycle leave the index unchanged
+        mappings = [{'cycle': cycle, 'delegate': delegate,
+                     'baking': encode_levels(baking_levels, first_level, last_level),
+                     'attestation': encode_levels(attestation_levels, first_level, last_level)}
+                    for delegate, (baking_levels, attestation_levels) in levels.items()]
+        self._delete_cycle(cycle)
+        self.session.bulk_insert_mappings(CycleRights, mappings)
+        self.session.add(IndexedCycle(cycle=cycle, first_level=first_level, last_level=last_level, delegates_fingerprint=self.fingerprint))
+        self.session.commit()
+        self.cycles[cycle] = (first_level, last_level)
+
+    def _load_levels(self, first_level, last_level):
+        """
+        Decode the rights of the levels first_level to last_level from the bitmaps of the cycles overlapping them.
+        """
+        self.bakers = {}
+        self.attesters = {}
+        cycles = {cycle: bounds[0] for cycle, bounds in self.cycles.items() if bounds[0] <= last_level and bounds[1] >= first_level}
+        for cycle, delegate, baking, attestation in self.session.query(
+                CycleRights.cycle, CycleRights.delegate, CycleRights.baking, CycleRights.attestation).filter(CycleRights.cycle.in_(list(cycles))):
+            for level in decode_levels(baking, cycles[cycle], first_level, last_level):
+                self.bakers[level] = delegate
+            for level in decode_levels(attestation, cycles[cycle], first_level, last_level):
+                self.attesters.setdefault(level, set()).add(delegate)
+        self.loaded = (first_level, last_level)
+
+    def prune(self, below_level):
+        """
+        Remove the cycles that end before below_level.
+        """
+        for cycle, (first_level, last_level) in list(self.cycles.items()):
+            if last_level < below_level:
+                self._delete_cycle(cycle)
+                del self.cycles[cycle]
+        self.session.commit()
+
+class RangeRights:
+    """
+    Rights of the monitored delegates for the block levels first_block_level to last_block_level, fetched in batches
+    of levels and kept in memory only. Used for historical levels, whose cycles the RightsIndex does not keep.
+    Has the lookup methods of RightsIndex.
+    """
+    def __init__(self, rpc, delegates, first_block_level, last_block_level):
+        self.first_block_level = first_block_level
+        self.last_block_level = last_block_level
+        self.bakers = {}
+        self.attesters = {}
+        delegates = list(delegates)
+        # The attestation rights of a level are checked in the next block
+        levels = list(range(first_block_level - 1, last_block_level + 1))
+        rights = {}
+        for i in range(0, len(levels), LEVELS_PER_QUERY):
+            batch = levels[i:i + LEVELS_PER_QUERY]
+            for j in range(0, len(delegates), DELEGATES_PER_QUERY):
+                chunk = delegates[j:j + DELEGATES_PER_QUERY]
+                # Rights of past levels are computed in the context of a block of the same period
+                collect_rights(rights, rpc.get_baking_rights_for_levels(batch[-1], batch, chunk, max_round=0),
+                               rpc.get_attestation_rights_for_levels(batch[-1], batch, chunk))
+        for (level, delegate), (baking, attestation) in rights.items():
+            if baking:
+                self.bakers[level] = delegate
+            if attestation:
+                self.attesters.setdefault(level, set()).add(delegate)
+
+    def covers(self, block_level):
+        return self.first_block_level <= block_level <= self.last_block_level
+
+    def get_baker(self, block_level):
+        return self.bakers.get(block_level)
+
+    def get_attesters(self, block_level):
+        return sorted(self.attesters.get(block_level - 1, ()))
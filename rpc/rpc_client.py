@@ -1,32 +1,269 @@
+import codecs
+import json
+import re
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeoutError, wait
+from urllib.parse import urlencode
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
+from rpc.cache import ResponseCache
+from rpc.node_pool import NodePool
+from metrics.registry import (RPC_ERRORS, RPC_REQUEST_SECONDS, RPC_RETRIES, RPC_NODE_FAILURES, RPC_HEDGED_REQUESTS,
+                              RPC_NODE_FINALIZED_LEVEL)
+from analysis.block_analysis import get_attesters, get_attesters_from_contents, get_block_attesters
+
+# Optional incremental JSON parser, used to extract attesters without decoding whole responses
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+_BLOCK_HASH_PATTERN = re.compile(r'^B[1-9A-HJ-NP-Za-km-z]{50}$')
+
+# Number of delegates and levels passed to a single bulk rights query, to keep the URL short
+DELEGATES_PER_QUERY = 50
+LEVELS_PER_QUERY = 100
+
+def endpoint_key(path):
+    """
+    Return the endpoint type of an RPC path, e.g. /chains/main/blocks/{block}/helpers/baking_rights.
+    """
+    segments = path.split('?', 1)[0].split('/')
+    # The segment after "blocks" identifies a specific block, collapse it when grouping stats by endpoint
+    for i in range(1, len(segments)):
+        if segments[i - 1] == 'blocks':
+            segments[i] = '{block}'
+    return '/'.join(segments)
 
 class RPC:
-    def __init__(self, node_url='http://localhost:8732'):
-        self.node_url = node_url
-        self.current_block = self.get_current_block()
-        self.current_level = self.get_current_level()
+    """
+    Client for one or more Tezos nodes. node_url is a URL, a comma-separated list of URLs or a list.
+    With several nodes, each request goes to the fastest healthy node and fails over to the others,
+    and reads of finalized data are hedged: sent to a second node too if the first one is slower than
+    its hedge_percentile latency. A hedge_percentile of 0 disables hedging.
+    With debug set, every GET is printed.
+    No request is made until the first call, so that creating a client is cheap.
+    """
+    def __init__(self, node_url='http://localhost:8732', pool_size=10, cache_max_bytes=64 * 1024 * 1024, stream_parse=False,
+                 hedge_percentile=90, max_lag=2, debug=False):
+        node_urls = node_url.split(',') if isinstance(node_url, str) else list(node_url)
+        node_urls = [url.strip().rstrip('/') for url in node_urls if url.strip()]
+        # URLs are built on the first node, get_url routes them to the best node
+        self.node_url = node_urls[0]
+        self.pool = NodePool(node_urls, hedge_percentile=hedge_percentile, max_lag=max_lag)
+        if stream_parse and ijson is None:
+            print("ijson is not installed, attestations will be parsed without streaming.")
+        self.stream_parse = stream_parse and ijson is not None
+        self.debug = debug
+        # One long-lived session per client, so that connections to the nodes are kept alive and reused.
+        # With several nodes, failing over to another node is faster than retrying the same one
+        attempts = 5 if len(node_urls) == 1 else 1
+        retries = Retry(
+            total=attempts,
+            read=attempts,
+            connect=attempts,
+            backoff_factor=0.2,
+            status_forcelist=[500, 502, 503, 504])
+        self.adapter = HTTPAdapter(pool_connections=max(pool_size, len(node_urls)), pool_maxsize=pool_size, max_retries=retries)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        # Per-endpoint counters: calls, new connections opened and accumulated latency
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        # Blocks and rights of finalized levels never change, so they are fetched at most once
+        self.cache = ResponseCache(max_bytes=cache_max_bytes)
+        self.finalized_level = None
+        # Runs both requests of a hedged read; the caller's thread only waits
+        self._hedge_executor = None
+        if len(node_urls) > 1 and hedge_percentile:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=2 * pool_size, thread_name_prefix='rpc-hedge')
         # Note: Not used.
         self.level_sliding_window = 100
         # Note: Not used.
         self.max_priority = 15
 
-    def get_url(self, url, timeout=10):
-        r = None
-        with requests.Session() as s:
-            retries = Retry(
-                total=5,
-                read=5,
-                connect=5,
-                backoff_factor=0.2,
-                status_forcelist=[500, 502, 503, 504])
-            s.mount('http://', HTTPAdapter(max_retries=retries))
-            s.mount('https://', HTTPAdapter(max_retries=retries))
+    def get_url(self, url, timeout=10, stream=False, hedge=False):
+        """
+        GET a URL built on self.node_url, from the fastest healthy node.
+        If hedge is set, the request is also sent to a second node when the first one is slow, see _get_hedged.
+        """
+        if self.debug:
             print('About to RPC GET '+url)
-            r = s.get(url, timeout=timeout)
+        if not url.startswith(self.node_url):
+            return self._get(None, url, endpoint_key(url), timeout, stream)
+        path = url[len(self.node_url):]
+        key = endpoint_key(path)
+        nodes = self.pool.ranked(key)
+        if hedge and not stream and self._hedge_executor is not None:
+            return self._get_hedged(path, key, nodes, timeout)
+        return self._get_failover(path, key, nodes, timeout, stream)
+
+    def _get(self, node, path, key, timeout, stream=False):
+        """
+        GET node.url + path, or path alone if node is None, and record the stats of the request.
+        """
+        url = path if node is None else node.url + path
+        connections_before = self._count_connections()
+        start = time.perf_counter()
+        try:
+            r = self.session.get(url, timeout=timeout, stream=stream)
+        except requests.RequestException:
+            RPC_ERRORS.inc(key)
+            raise
+        elapsed = time.perf_counter() - start
+        # Attempts retried by the adapter before this response
+        retries = getattr(r.raw, 'retries', None)
+        retried = len(retries.history) if retries is not None else 0
+        # The size of a streamed response is only known once it has been read, see record_bytes
+        self._record(key, elapsed, self._count_connections() - connections_before, 0 if stream else len(r.content), retried)
+        if node is not None and r.ok:
+            self.pool.record_success(node, key, elapsed)
         return r
 
+    def _get_failover(self, path, key, nodes, timeout, stream=False):
+        """
+        GET path from the first node that answers. Nodes that fail are skipped for a while, see NodePool.
+        """
+        error = None
+        for index, node in enumerate(nodes):
+            try:
+                r = self._get(node, path, key, timeout, stream)
+            except requests.RequestException as e:
+                self.pool.record_failure(node)
+                RPC_NODE_FAILURES.inc(node.url)
+                if index < len(nodes) - 1:
+                    print(f"RPC node {node.url} failed: {e}. Trying the next node.")
+                error = e
+                continue
+            # A lagging node may not know the requested block yet, another one may
+            if r.status_code == 404 and index < len(nodes) - 1:
+                r.close()
+                continue
+            return r
+        raise error
+
+    def _get_hedged(self, path, key, nodes, timeout):
+        """
+        GET path from the fastest node and, if it has not answered within its usual latency, from the next node too.
+        Returns the first successful response. Only used for responses that are the same on every node.
+        """
+        primary = self._hedge_executor.submit(self._get_failover, path, key, nodes, timeout)
+        try:
+            return primary.result(timeout=self.pool.hedge_delay(nodes[0], key))
+        except FutureTimeoutError:
+            pass
+        hedged = self._hedge_executor.submit(self._get_failover, path, key, nodes[1:] + nodes[:1], timeout)
+        futures = {primary: nodes[0], hedged: nodes[1]}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result():
+                    RPC_HEDGED_REQUESTS.inc(futures[future].url)
+                    return future.result()
+        # Both failed: report the outcome of the fastest node
+        return primary.result()
+
+    def _count_connections(self):
+        """
+        Total number of connections opened so far by the pools of the adapter.
+        """
+        pools = self.adapter.poolmanager.pools
+        return sum(pool.num_connections for pool in (pools.get(key) for key in pools.keys()) if pool is not None)
+
+    def _endpoint_key(self, url):
+        for node in self.pool.nodes:
+            if url.startswith(node.url):
+                return endpoint_key(url[len(node.url):])
+        return endpoint_key(url)
+
+    def _stats_entry(self, key):
+        return self.stats.setdefault(key, {'calls': 0, 'new_connections': 0, 'retries': 0, 'total_time': 0.0, 'max_time': 0.0, 'bytes': 0})
+
+    def _record(self, key, elapsed, new_connections, size, retried=0):
+        with self._stats_lock:
+            entry = self._stats_entry(key)
+            entry['calls'] += 1
+            entry['new_connections'] += max(new_connections, 0)
+            entry['retries'] += retried
+            entry['total_time'] += elapsed
+            entry['max_time'] = max(entry['max_time'], elapsed)
+            entry['bytes'] += size
+        RPC_REQUEST_SECONDS.observe(elapsed, key)
+        if retried:
+            RPC_RETRIES.inc(key, amount=retried)
+
+    def record_bytes(self, url, size):
+        with self._stats_lock:
+            self._stats_entry(self._endpoint_key(url))['bytes'] += size
+
+    def total_bytes(self):
+        return sum(entry['bytes'] for entry in self.stats.values())
+
+    def print_stats(self):
+        """
+        Print connection reuse, latency and bytes received per endpoint type, and the state of each node.
+        Connection reuse is approximate when requests run concurrently.
+        """
+        for key, entry in sorted(self.stats.items()):
+            reused = max(entry['calls'] - entry['new_connections'], 0)
+            average_ms = 1000 * entry['total_time'] / entry['calls']
+            print(f"RPC {key}: {entry['calls']} calls, {reused} on reused connections, {entry['retries']} retries, avg {average_ms:.1f} ms, max {1000 * entry['max_time']:.1f} ms, {entry['bytes']} bytes")
+        if len(self.pool.nodes) > 1:
+            self.pool.print_stats()
+
+    def _cache_key(self, kind, block):
+        """
+        Return the cache key for a block level or hash, or None if the block may still change.
+        """
+        if isinstance(block, int) or (isinstance(block, str) and block.isdigit()):
+            level = int(block)
+            if self.finalized_level is not None and level <= self.finalized_level:
+                return (kind, level)
+            return None
+        if isinstance(block, str) and _BLOCK_HASH_PATTERN.match(block):
+            return (kind, block)
+        return None
+
+    def _get_cached(self, kind, block, url, timeout, parse=None, stream=False):
+        """
+        GET url and decode it, using the cache for finalized blocks.
+        parse(response) returns the decoded value and its approximate size in bytes; by default the JSON is decoded.
+        Returns the decoded value (None on failure) and whether the response was successful.
+        """
+        key = self._cache_key(kind, block)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached, True
+        # Finalized data is the same on every node, so slow reads of it can be hedged
+        with self.get_url(url, timeout=timeout, stream=stream, hedge=key is not None) as r:
+            if not r:
+                return None, False
+            data, size = parse(r) if parse else (r.json(), len(r.content))
+        if key is not None:
+            self.cache.put(key, data, size)
+        return data, True
+
+    def _parse_attesters(self, r):
+        if not self.stream_parse:
+            attesters = get_attesters(r.json())
+        else:
+            # Only one operation content at a time is built, never the whole list of operations
+            r.raw.decode_content = True
+            attesters = get_attesters_from_contents(ijson.items(r.raw, 'item.contents.item'))
+            self.record_bytes(r.url, r.raw.tell())
+        # Rough in-memory size of a set of tz addresses
+        return attesters, 100 * len(attesters) + 256
+
+    def close(self):
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.session.close()
+
     def get_current_block(self, timeout=10):
         url = '{}/monitor/bootstrapped'.format(self.node_url)
         r = self.get_url(url, timeout=timeout)
@@ -34,22 +271,121 @@ class RPC:
 
     def get_block_info(self, block, timeout=10):
         url = '{}/chains/main/blocks/{}'.format(self.node_url, block)
-        r = self.get_url(url, timeout=timeout)
-        return r.json()
+        block_info, ok = self._get_cached('block', block, url, timeout)
+        if not ok:
+            raise requests.HTTPError('Failed to fetch block {}'.format(block))
+        return block_info
+
+    def get_block_baker(self, block, timeout=10):
+        """
+        Baker of a block, read from the block metadata only.
+        """
+        url = '{}/chains/main/blocks/{}/metadata'.format(self.node_url, block)
+        baker, ok = self._get_cached('baker', block, url, timeout, parse=lambda r: (r.json()['baker'], 64))
+        if not ok:
+            raise requests.HTTPError('Failed to fetch metadata of block {}'.format(block))
+        return baker
+
+    def get_block_attesters(self, block, timeout=10):
+        """
+        Set of delegates whose attestations are included in a block, read from validation pass 0 only.
+        """
+        url = '{}/chains/main/blocks/{}/operations/0'.format(self.node_url, block)
+        attesters, ok = self._get_cached('attesters', block, url, timeout, parse=self._parse_attesters, stream=self.stream_parse)
+        if not ok:
+            raise requests.HTTPError('Failed to fetch attestations of block {}'.format(block))
+        return attesters
 
     def get_latest_finalized_level(self, timeout=10):
-        url = '{}/chains/main/blocks/head~2'.format(self.node_url)
-        r = self.get_url(url, timeout=timeout)
-        header = r.json()['header']
-        return header['level'] 
+        """
+        Level of head~2. With several nodes, every node is asked: nodes lagging behind the most advanced one are
+        skipped until the next check, and nodes reporting a different block at the same level are marked as failed.
+        """
+        if len(self.pool.nodes) == 1:
+            url = '{}/chains/main/blocks/head~2/header'.format(self.node_url)
+            r = self.get_url(url, timeout=timeout)
+            header = r.json()
+            self.finalized_level = header['level']
+            return header['level']
+        print('About to RPC GET head~2 header from {} nodes'.format(len(self.pool.nodes)))
+        path = '/chains/main/blocks/head~2/header'
+        key = endpoint_key(path)
+        with ThreadPoolExecutor(max_workers=len(self.pool.nodes)) as executor:
+            futures = {node: executor.submit(self._get, node, path, key, timeout) for node in self.pool.nodes}
+        headers = {}
+        for node, future in futures.items():
+            try:
+                r = future.result()
+                r.raise_for_status()
+                headers[node] = r.json()
+            except (requests.RequestException, ValueError) as e:
+                self.pool.record_failure(node)
+                RPC_NODE_FAILURES.inc(node.url)
+                print(f"RPC node {node.url} failed to return head~2: {e}")
+        if not headers:
+            raise requests.HTTPError('No RPC node returned head~2')
+        self._check_agreement(headers)
+        levels = {node: header['level'] for node, header in headers.items()}
+        for node, level in levels.items():
+            RPC_NODE_FINALIZED_LEVEL.set(level, node.url)
+        self.finalized_level = self.pool.update_finalized_levels(levels)
+        for node in self.pool.nodes:
+            if node.lagging:
+                print(f"RPC node {node.url} is lagging: finalized level {node.finalized_level}, {self.finalized_level} on the most advanced node")
+        return self.finalized_level
+
+    def _check_agreement(self, headers):
+        """
+        Mark the nodes whose head~2 differs from the majority of the nodes at the same level as failed.
+        On a tie, the node listed first wins.
+        """
+        by_level = {}
+        for node, header in headers.items():
+            by_level.setdefault(header['level'], {}).setdefault(header['hash'], []).append(node)
+        for level, by_hash in by_level.items():
+            if len(by_hash) < 2:
+                continue
+            majority = max(by_hash, key=lambda block_hash: len(by_hash[block_hash]))
+            description = ', '.join(f"{node.url} {block_hash}" for block_hash, nodes in by_hash.items() for node in nodes)
+            print(f"RPC nodes disagree on the block at level {level}: {description}")
+            for block_hash, nodes in by_hash.items():
+                if block_hash != majority:
+                    for node in nodes:
+                        self.pool.record_failure(node)
+                        RPC_NODE_FAILURES.inc(node.url)
+                        del headers[node]
 
     def get_current_level(self, timeout=10):
-        block_info = self.get_block_info(self.current_block, timeout=timeout)
-        header = block_info['header']
-        return header['level']
+        url = '{}/chains/main/blocks/{}/header'.format(self.node_url, self.get_current_block(timeout=timeout))
+        r = self.get_url(url, timeout=timeout)
+        r.raise_for_status()
+        return r.json()['level']
+
+    def monitor_heads(self, timeout=60):
+        """
+        Yield the heads of the main chain as the node announces them on the /monitor/heads/main stream.
+        Raises if no data arrives within timeout seconds; the stream ends when the node closes it.
+        """
+        url = '{}/monitor/heads/main'.format(self.pool.ranked(endpoint_key('/monitor/heads/main'))[0].url)
+        print('About to RPC stream '+url)
+        decoder = json.JSONDecoder()
+        text_decoder = codecs.getincrementaldecoder('utf-8')()
+        with self.session.get(url, stream=True, timeout=(10, timeout)) as r:
+            r.raise_for_status()
+            buffer = ''
+            for chunk in r.iter_content(chunk_size=None):
+                buffer += text_decoder.decode(chunk)
+                # A chunk may contain several heads, or only part of one
+                while True:
+                    buffer = buffer.lstrip()
+                    try:
+                        head, end = decoder.raw_decode(buffer)
+                    except ValueError:
+                        break
+                    buffer = buffer[end:]
+                    yield head
 
     def get_nth_predecessor(self, n, timeout=10):
-        block_hash = self.get_current_block(timeout=timeout)
         level = int(self.get_current_level(timeout=timeout))
         url = '{}/chains/main/blocks/{}/header'.format(self.node_url, level - n)
         r = self.get_url(url, timeout=timeout)
@@ -58,42 +394,126 @@ class RPC:
     def get_baking_opportunities_for_level(self, level, timeout=10):
         opportunities = []
         url = '{}/chains/main/blocks/{}~1/helpers/baking_rights'.format(self.node_url, level)
-        r = self.get_url(url, timeout=timeout)
-        if r:
-            opportunities = r.json()
+        rights, ok = self._get_cached('baking_rights', level, url, timeout)
+        if ok:
+            opportunities = rights
         return opportunities
 
     def get_baking_opportunities_for_block(self, block_hash, timeout=10):
         opportunities = []
         url = '{}/chains/main/blocks/{}~1/helpers/baking_rights'.format(self.node_url, block_hash)
-        r = self.get_url(url, timeout=timeout)
-        if r:
-            opportunities = r.json()
+        rights, ok = self._get_cached('baking_rights', block_hash, url, timeout)
+        if ok:
+            opportunities = rights
         return opportunities
 
     def get_attestation_opportunities_for_level(self, level, timeout=10):
         opportunities = []
         url = '{}/chains/main/blocks/{}~1/helpers/attestation_rights'.format(self.node_url, level)
-        r = self.get_url(url, timeout=timeout)
-        if r:
-            opportunities = r.json()[0]["delegates"]
+        rights, ok = self._get_cached('attestation_rights', level, url, timeout)
+        if ok:
+            opportunities = rights[0]["delegates"]
         return opportunities
 
     def get_attestation_opportunities_for_block(self, block_hash, timeout=10):
         opportunities = []
         url = '{}/chains/main/blocks/{}~1/helpers/attestation_rights'.format(self.node_url, block_hash)
-        r = self.get_url(url, timeout=timeout)
-        if r:
-            opportunities = r.json()[0]["delegates"]
+        rights, ok = self._get_cached('attestation_rights', block_hash, url, timeout)
+        if ok:
+            opportunities = rights[0]["delegates"]
         return opportunities
 
+    def get_baking_rights_for_level(self, level, delegates=None, max_round=0, timeout=10):
+        """
+        Baking rights up to max_round for a single level, filtered by the node to the given delegates if any.
+        Finalized levels are cached, assuming the same delegates are given on every call.
+        """
+        params = [('max_round', max_round)] + [('delegate', delegate) for delegate in delegates or ()]
+        url = '{}/chains/main/blocks/{}~1/helpers/baking_rights?{}'.format(self.node_url, level, urlencode(params))
+        rights, ok = self._get_cached('baking_rights_filtered', level, url, timeout)
+        if not ok:
+            raise requests.HTTPError('Failed to fetch baking rights of level {}'.format(level))
+        return rights
+
+    def get_attestation_rights_for_level(self, level, delegates=None, timeout=10):
+        """
+        Attestation rights checked in the block of the given level, filtered by the node to the given delegates if any.
+        Finalized levels are cached, assuming the same delegates are given on every call.
+        """
+        params = [('delegate', delegate) for delegate in delegates or ()]
+        url = '{}/chains/main/blocks/{}~1/helpers/attestation_rights?{}'.format(self.node_url, level, urlencode(params))
+        rights, ok = self._get_cached('attestation_rights_filtered', level, url, timeout)
+        if not ok:
+            raise requests.HTTPError('Failed to fetch attestation rights of level {}'.format(level))
+        # Without any right of the given delegates, the node may return no entry for the level
+        return rights[0]['delegates'] if rights else []
+
+    def get_level_info(self, block='head', timeout=10):
+        url = '{}/chains/main/blocks/{}/helpers/current_level'.format(self.node_url, block)
+        r = self.get_url(url, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def get_levels_in_cycle(self, offset=0, block='head', timeout=10):
+        """
+        First and last level of the cycle `offset` cycles after the cycle of block, as computed by the protocol,
+        which knows the blocks_per_cycle of past cycles.
+        """
+        url = '{}/chains/main/blocks/{}/helpers/levels_in_current_cycle?offset={}'.format(self.node_url, block, offset)
+        r = self.get_url(url, timeout=timeout)
+        r.raise_for_status()
+        levels = r.json()
+        return levels['first'], levels['last']
+
+    def get_constants(self, block='head', timeout=10):
+        url = '{}/chains/main/blocks/{}/context/constants'.format(self.node_url, block)
+        r = self.get_url(url, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def get_baking_rights_for_cycle(self, cycle, delegates, max_round=0, timeout=60):
+        """
+        Baking rights up to max_round of the given delegates for a whole cycle, in a single call.
+        """
+        params = [('cycle', cycle), ('max_round', max_round)] + [('delegate', delegate) for delegate in delegates]
+        url = '{}/chains/main/blocks/head/helpers/baking_rights?{}'.format(self.node_url, urlencode(params))
+        r = self.get_url(url, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def get_attestation_rights_for_cycle(self, cycle, delegates, timeout=60):
+        """
+        Attestation rights of the given delegates for a whole cycle, in a single call.
+        """
+        params = [('cycle', cycle)] + [('delegate', delegate) for delegate in delegates]
+        url = '{}/chains/main/blocks/head/helpers/attestation_rights?{}'.format(self.node_url, urlencode(params))
+        r = self.get_url(url, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def get_baking_rights_for_levels(self, block, levels, delegates, max_round=0, timeout=60):
+        """
+        Baking rights up to max_round of the given delegates for the given levels, computed in the context of `block`.
+        Rights of past levels are only available from blocks of nearby cycles.
+        """
+        params = [('level', level) for level in levels] + [('max_round', max_round)] + [('delegate', delegate) for delegate in delegates]
+        url = '{}/chains/main/blocks/{}/helpers/baking_rights?{}'.format(self.node_url, block, urlencode(params))
+        r = self.get_url(url, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def get_attestation_rights_for_levels(self, block, levels, delegates, timeout=60):
+        """
+        Attestation rights of the given delegates for the given levels, computed in the context of `block`.
+        """
+        params = [('level', level) for level in levels] + [('delegate', delegate) for delegate in delegates]
+        url = '{}/chains/main/blocks/{}/helpers/attestation_rights?{}'.format(self.node_url, block, urlencode(params))
+        r = self.get_url(url, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
     def block_was_attested_by_delegate(self, block_info, delegate_hash):
-        was_attesteded = False
-        for op in block_info['operations'][0]:
-            for item in op['contents']:
-                if (item['kind'] == 'attestation' or item['kind'] == 'attestation_with_dal') and item['metadata']['delegate'] == delegate_hash:
-                    was_attesteded = True
-        return was_attesteded
+        return delegate_hash in get_block_attesters(block_info)
 
     def block_iter(self, starting_block):
         block_info = self.get_block_info(starting_block)
@@ -0,0 +1,99 @@
+"""
+Batching of the alert dispatcher and of the CloudWatch channel.
+"""
+import types
+import pytest
+from alerting.dispatcher import AlertDispatcher, CloudWatchChannel
+
+class RecordingChannel:
+    """
+    Channel recording the messages of each flush that had pending messages.
+    """
+    name = 'Recording'
+
+    def __init__(self):
+        self.pending = []
+        self.flushes = []
+
+    def accepts(self, is_alert):
+        return True
+
+    def add(self, timestamp, message):
+        self.pending.append(message)
+
+    def flush(self, force=False):
+        if self.pending:
+            self.flushes.append(self.pending)
+            self.pending = []
+
+class FakeLogsClient:
+    """
+    CloudWatch Logs client whose put_log_events calls fail `failures` times before succeeding.
+    """
+    exceptions = types.SimpleNamespace(ResourceAlreadyExistsException=type('ResourceAlreadyExistsException', (Exception,), {}))
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    def create_log_group(self, logGroupName):
+        pass
+
+    def create_log_stream(self, logGroupName, logStreamName):
+        pass
+
+    def put_log_events(self, logGroupName, logStreamName, logEvents):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('put_log_events failed')
+        self.batches.append([event['message'] for event in logEvents])
+
+def test_messages_submitted_together_are_flushed_in_one_batch():
+    channel = RecordingChannel()
+    dispatcher = AlertDispatcher([channel], flush_interval=0.5)
+    for index in range(5):
+        dispatcher.submit(f'alert {index}', True)
+    dispatcher.shutdown()
+    assert channel.flushes == [[f'alert {index}' for index in range(5)]]
+
+def test_batches_are_limited_to_max_batch():
+    channel = RecordingChannel()
+    dispatcher = AlertDispatcher([channel], flush_interval=0.5, max_batch=2)
+    for index in range(5):
+        dispatcher.submit(f'alert {index}', True)
+    dispatcher.shutdown()
+    assert [len(messages) for messages in channel.flushes] == [2, 2, 1]
+    assert sum(channel.flushes, []) == [f'alert {index}' for index in range(5)]
+
+def test_cloudwatch_keeps_events_until_they_are_accepted():
+    client = FakeLogsClient(failures=1)
+    channel = CloudWatchChannel('group', 'stream', lambda: client)
+    # Added out of order; a batch must be in chronological order
+    channel.add(2000, 'second')
+    channel.add(1000, 'first')
+    with pytest.raises(ConnectionError):
+        channel.flush()
+    assert [event['message'] for event in channel.pending] == ['first', 'second']
+    channel.flush()
+    assert client.batches == [['first', 'second']]
+    assert channel.pending == []
+
+def test_cloudwatch_keeps_only_the_events_of_failed_batches(monkeypatch):
+    monkeypatch.setattr('alerting.dispatcher.CLOUDWATCH_MAX_BATCH_EVENTS', 2)
+    client = FakeLogsClient()
+    channel = CloudWatchChannel('group', 'stream', lambda: client)
+    for index in range(5):
+        channel.add(1000 + index, f'event {index}')
+    put_log_events = client.put_log_events
+    calls = []
+
+    def fail_second_batch(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 2:
+            raise ConnectionError('put_log_events failed')
+        put_log_events(**kwargs)
+    client.put_log_events = fail_second_batch
+    with pytest.raises(ConnectionError):
+        channel.flush()
+    assert client.batches == [['event 0', 'event 1']]
+    assert [event['message'] for event in channel.pending] == ['event 2', 'event 3', 'event 4']
@@ -0,0 +1,36 @@
+"""
+Encoding and decoding of the per-cycle rights bitmaps.
+"""
+import pytest
+from rpc.rights_index import decode_levels, encode_levels
+
+FIRST_LEVEL = 1000
+LAST_LEVEL = 1019
+
+def test_round_trip_keeps_the_first_and_last_levels():
+    levels = [1000, 1007, 1008, 1013, 1019]
+    bitmap = encode_levels(levels, FIRST_LEVEL, LAST_LEVEL)
+    assert len(bitmap) == 3
+    assert list(decode_levels(bitmap, FIRST_LEVEL, FIRST_LEVEL, LAST_LEVEL)) == levels
+
+def test_bit_layout():
+    # The right at first_level + i is bit i % 8 of byte i // 8
+    assert encode_levels([1000, 1009], FIRST_LEVEL, LAST_LEVEL) == bytes([0b1, 0b10, 0])
+
+def test_decode_reads_only_the_requested_levels():
+    bitmap = encode_levels(range(FIRST_LEVEL, LAST_LEVEL + 1), FIRST_LEVEL, LAST_LEVEL)
+    assert list(decode_levels(bitmap, FIRST_LEVEL, 1006, 1009)) == [1006, 1007, 1008, 1009]
+    # Requested levels outside of the bitmap are ignored
+    assert list(decode_levels(bitmap, FIRST_LEVEL, 990, 1001)) == [1000, 1001]
+    assert list(decode_levels(bitmap, FIRST_LEVEL, 1018, 1030)) == [1018, 1019]
+    assert list(decode_levels(bitmap, FIRST_LEVEL, 1030, 1040)) == []
+
+def test_empty_bitmap():
+    bitmap = encode_levels([], FIRST_LEVEL, LAST_LEVEL)
+    assert bitmap == bytes(3)
+    assert list(decode_levels(bitmap, FIRST_LEVEL, FIRST_LEVEL, LAST_LEVEL)) == []
+
+@pytest.mark.parametrize('level', [FIRST_LEVEL - 1, LAST_LEVEL + 1, LAST_LEVEL + 5])
+def test_encode_rejects_levels_outside_of_the_range(level):
+    with pytest.raises(ValueError, match=str(level)):
+        encode_levels([FIRST_LEVEL, level], FIRST_LEVEL, LAST_LEVEL)
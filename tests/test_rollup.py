@@ -0,0 +1,88 @@
+"""
+Per-cycle rollups folded batch by batch, compared with a recount from the raw rows.
+"""
+from database.db import BlockAttestation, BlockBaking, CycleRollup, WriteBatch, get_engine, get_session, init_db
+from database.rollup import Cycles, fold_batch
+
+# Cycle 10 starts at level 1000, cycles are 8 levels long
+CYCLES = Cycles({'cycle': 10, 'level': 1000, 'cycle_position': 0}, 8)
+FIRST_LEVEL = 1000
+LAST_LEVEL = 1023
+# Misses of the baker; the run from 1006 to 1009 spans the boundary between cycles 10 and 11
+BAKING_MISSES = {1002, 1006, 1007, 1008, 1009, 1015, 1016}
+# Misses of the attester; the run from 1014 to 1017 spans the boundary between cycles 11 and 12, and 1023 is left open
+ATTESTATION_MISSES = {1001, 1014, 1015, 1016, 1017, 1020, 1023}
+
+def open_memory_session():
+    engine = get_engine('sqlite://')
+    init_db(engine)
+    return get_session(engine)
+
+def fill_batch(first_level, last_level):
+    batch = WriteBatch()
+    for level in range(first_level, last_level + 1):
+        batch.add_baking(level, 'tz1baker', 0 if level in BAKING_MISSES else 1)
+        batch.add_attestation(level, 'tz1attester', 0 if level in ATTESTATION_MISSES else 1)
+    return batch
+
+def recount(session, model):
+    """
+    Rollup fields by (delegate, cycle), recounted from the raw rows in level order.
+    """
+    counts = {}
+    streaks = {}
+    for row in session.query(model).order_by(model.block_level):
+        key = (row.delegate, CYCLES.cycle_of(row.block_level))
+        fields = counts.setdefault(key, {'rights': 0, 'misses': 0, 'recoveries': 0, 'longest_streak': 0})
+        fields['rights'] += 1
+        streak = streaks.get(row.delegate, 0)
+        if row.successful:
+            fields['recoveries'] += 1 if streak else 0
+            streak = 0
+        else:
+            streak += 1
+            fields['misses'] += 1
+            fields['longest_streak'] = max(fields['longest_streak'], streak)
+        streaks[row.delegate] = streak
+    return counts
+
+def rollup_counts(session, kind):
+    return {(rollup.delegate, rollup.cycle): {field: getattr(rollup, f'{kind}_{field}')
+                                              for field in ('rights', 'misses', 'recoveries', 'longest_streak')}
+            for rollup in session.query(CycleRollup) if getattr(rollup, f'{kind}_rights')}
+
+def test_monitor_batches_match_a_recount_across_cycle_boundaries():
+    session = open_memory_session()
+    # Batch boundaries fall inside the runs of misses and inside the cycles
+    for first_level in range(FIRST_LEVEL, LAST_LEVEL + 1, 5):
+        batch = fill_batch(first_level, min(first_level + 4, LAST_LEVEL))
+        fold_batch(session, batch, CYCLES)
+        batch.flush(session)
+        session.commit()
+
+    assert rollup_counts(session, 'baking') == recount(session, BlockBaking)
+    assert rollup_counts(session, 'attestation') == recount(session, BlockAttestation)
+    # The run started in cycle 10 counts as one run of 4 misses, recovered in cycle 11
+    cycle_10 = session.get(CycleRollup, ('tz1baker', 10))
+    cycle_11 = session.get(CycleRollup, ('tz1baker', 11))
+    assert (cycle_10.baking_longest_streak, cycle_10.baking_recoveries) == (2, 1)
+    assert (cycle_11.baking_longest_streak, cycle_11.baking_recoveries) == (4, 1)
+    # Only the run still open at the last level is kept
+    assert session.get(CycleRollup, ('tz1attester', 12)).attestation_streak == 1
+    assert [rollup.cycle for rollup in session.query(CycleRollup).filter(CycleRollup.attestation_streak > 0)] == [12]
+
+def test_backfill_streaks_match_the_monitor():
+    monitor = open_memory_session()
+    batch = fill_batch(FIRST_LEVEL, LAST_LEVEL)
+    fold_batch(monitor, batch, CYCLES)
+    monitor.commit()
+
+    backfill = open_memory_session()
+    streaks = {}
+    for first_level in range(FIRST_LEVEL, LAST_LEVEL + 1, 7):
+        fold_batch(backfill, fill_batch(first_level, min(first_level + 6, LAST_LEVEL)), CYCLES, streaks)
+    backfill.commit()
+
+    for kind in ('baking', 'attestation'):
+        assert rollup_counts(backfill, kind) == rollup_counts(monitor, kind)
+    assert streaks == {('tz1baker', 'baking'): 0, ('tz1attester', 'attestation'): 1}